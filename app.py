@@ -3,8 +3,14 @@ import covid_app.layout
 import logging
 
 import dash
-from coviddata import COVIDData
+from coviddata import COVIDData, COVIDEnum
+from derivedmetrics import DerivedMetrics
+from figurecache import FigureCache
+from memoryreport import MemoryReport
 from populationdata import PopulationData
+from projections import Projections
+from rankings import COVIDRankings
+from usdata import USCountyData
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +18,10 @@ logger = logging.getLogger(__name__)
 app = None
 covid_data = None
 population_data = None
+rankings = None
+derived_metrics = None
+projections = None
+us_data = None
 
 
 def create():
@@ -30,23 +40,110 @@ def create():
     return app
 
 
-def set_data(input_covid_data: COVIDData, input_pop_data: PopulationData):
+def set_data(input_covid_data: COVIDData, input_pop_data: PopulationData,
+             input_us_data: USCountyData = None, projection_workers: int = None,
+             enable_projections: bool = True):
     """Pass data into the application to permit access to Dash components
 
     Arguments:
         input_covid_data {COVIDData} -- COVID-19 datasets
         input_pop_data {PopulationData} -- Population datasets
+
+    Keyword Arguments:
+        input_us_data {USCountyData} -- US county level datasets
+                                        (default: {None})
+        projection_workers {int} -- Number of processes fitting the
+                                    projections, None for the number of CPUs
+                                    (default: {None})
+        enable_projections {bool} -- Fit the projections of the datasets
+                                     (default: {True})
     """
     global covid_data
     global population_data
+    global rankings
+    global derived_metrics
+    global projections
+    global us_data
 
-    covid_data = covid_data
+    covid_data = input_covid_data
     population_data = input_pop_data
-    
-    covid_app.callbacks._set_data(input_covid_data, input_pop_data)
+    us_data = input_us_data
+    rankings = COVIDRankings(input_covid_data)
+    derived_metrics = DerivedMetrics(input_covid_data, input_pop_data)
+    projections = None
+    if enable_projections:
+        projections = Projections(
+            input_covid_data, max_workers=projection_workers)
+
+    covid_app.callbacks._set_data(
+        input_covid_data, input_pop_data, rankings, derived_metrics,
+        projections)
     covid_app.layout._set_data(input_covid_data, input_pop_data)
 
 
+def set_figure_cache(path: str, max_bytes: int):
+    """Share the computed figure payloads between the worker processes
+    through a cache on local disk. Entries stored by other processes are
+    kept, their keys include the version of the data they were computed
+    from.
+
+    Arguments:
+        path {str} -- Path of the cache database file
+        max_bytes {int} -- Maximum total size of the cached payloads
+    """
+    logger.info(f'Using figure cache {path}')
+    covid_app.callbacks._set_figure_cache(FigureCache(path, max_bytes))
+
+
+def clear_figure_cache(path: str):
+    """Remove the entries of a previous run from a figure cache
+
+    Arguments:
+        path {str} -- Path of the cache database file
+    """
+    logger.info(f'Clearing figure cache {path}')
+    FigureCache(path).clear()
+
+
+def get_memory_report():
+    """Measure the memory held by the loaded datasets and the application
+    layout
+
+    Returns:
+        str -- The formatted report
+    """
+    report = MemoryReport()
+    if covid_data is not None:
+        report.add('COVID-19 data', covid_data,
+                   len(covid_data.get_countries()) *
+                   len(covid_data.get_dates()) * len(COVIDEnum))
+    report.add('Population data', population_data)
+    report.add('US county data', us_data)
+    report.add('Derived metrics', derived_metrics)
+    report.add('Rankings', rankings)
+    report.add('Projections', projections)
+    if app is not None and app.layout is not None:
+        search_options = app.layout['search-field'].options
+        report.add('Search dropdown options', search_options,
+                   len(search_options))
+        report.add('Dash layout tree', app.layout, len(app.layout))
+    return report.format()
+
+
+def enable_memory_endpoint(path: str = '/_memory-report'):
+    """Serve the memory report of the worker that handles the request
+
+    Keyword Arguments:
+        path {str} -- URL path of the report (default: {'/_memory-report'})
+    """
+    logger.info(f'Serving memory reports on {path}')
+
+    def memory_report():
+        return get_memory_report(), 200, {'Content-Type': 'text/plain'}
+
+    app.server.add_url_rule(path, 'memory_report', memory_report)
+
+
 def start():
     """Start the Dash application
 
@@ -1,14 +1,107 @@
 from dash.dependencies import Input, Output, State
 import dash_core_components as dcc
+import json
 import logging
+from datetime import date, timedelta
 
-from coviddata import COVIDData
+from coviddata import COVIDData, COVIDEnum
+from derivedmetrics import CFR, DerivedMetrics
+from figurecache import FigureCache
 from populationdata import PopulationData
+from projections import Projections
+from rankings import COVIDRankings, RankingMetric
 
 logger = logging.getLogger(__name__)
 
 covid_data = None
 population_data = None
+rankings = None
+derived_metrics = None
+projections = None
+figure_cache = None
+
+RANKING_MODES = {
+    'top-total': (RankingMetric.TOTAL, 'total'),
+    'top-new-week': (RankingMetric.NEW_WEEK, 'new this week'),
+}
+RANKING_SIZE = 10
+# Metric of each data type found in the search dropdown values
+METRICS = dict({data_type.value: data_type for data_type in COVIDEnum},
+               **{CFR: CFR})
+# Number of trailing days plotted for each value of the date range radio
+# button group, None plots every date
+DATE_RANGES = {
+    'all': None,
+    '90': 90,
+    '30': 30,
+}
+
+# Data type and threshold that series are aligned on for each value of the
+# alignment radio button group, None plots series against their dates
+ALIGNMENTS = {
+    'date': None,
+    'infected:100': (COVIDEnum.INFECTED, 100, '100th case'),
+    'infected:1000': (COVIDEnum.INFECTED, 1000, '1000th case'),
+    'dead:10': (COVIDEnum.DEAD, 10, '10th death'),
+    'dead:100': (COVIDEnum.DEAD, 100, '100th death'),
+}
+
+# Builds the main-plot figure from the JSON encoded series-store data.
+# Normalization and chart type changes are applied in the browser without a
+# server round trip.
+FIGURE_CLIENTSIDE_CALLBACK = """
+function(storeJson, normalization, infectedType, deadType, recoveredType) {
+    if (!storeJson) {
+        return {data: [], layout: {title: 'COVID-19 Data'}};
+    }
+    var store = JSON.parse(storeJson);
+    if (store.figure) {
+        return store.figure;
+    }
+
+    var scales = {'per-capita': 1, 'per-1000': 1000, 'per-100k': 100000};
+    var chartTypes = {
+        infected: infectedType,
+        dead: deadType,
+        recovered: recoveredType,
+        cfr: deadType
+    };
+    var scale = scales[normalization];
+
+    var data = [];
+    store.series.forEach(function(series) {
+        // The values of every series are stored one after the other
+        var y = store.values.slice(series.offset, series.offset + series.length);
+        if (scale && series.normalize) {
+            if (!series.population) {
+                return;
+            }
+            y = y.map(function(value) {
+                return value * scale / series.population;
+            });
+        }
+        var trace = {
+            type: chartTypes[series.data_type],
+            x: store.x.slice(series.x_offset, series.x_offset + series.length),
+            y: y,
+            text: series.name,
+            name: series.name
+        };
+        if (series.projection) {
+            trace.type = 'scatter';
+            trace.mode = 'lines';
+            trace.line = {dash: 'dash'};
+        }
+        data.push(trace);
+    });
+
+    var layout = {title: store.title};
+    if (store.x_title) {
+        layout.xaxis = {title: {text: store.x_title}};
+    }
+    return {data: data, layout: layout};
+}
+"""
 
 
 def register_callbacks(app):
@@ -21,68 +114,226 @@ def register_callbacks(app):
     logger.info('Registering Dash callbacks')
 
     @app.callback(
-        Output('main-plot', 'figure'),
+        Output('series-store', 'data'),
         [
             Input('search-field', 'value'),
-            Input('normalization-rb', 'value'),
-            Input('chart-infected-rb', 'value'),
-            Input('chart-dead-rb', 'value'),
-            Input('chart-recovered-rb', 'value'),
+            Input('plot-mode-rb', 'value'),
+            Input('date-range-rb', 'value'),
+            Input('alignment-rb', 'value'),
+            Input('projections-cl', 'value'),
         ]
     )
-    def search_callback(request_items, normalization, chart_infected_type, chart_dead_type, chart_recovered_type):
-        """Callback that generates the data for the main-plot figure
+    def search_callback(request_items, plot_mode, date_range, alignment,
+                        projection_options):
+        """Callback that retrieves the raw series of the selected items. The
+        series are normalized and turned into the main-plot figure in the
+        browser by FIGURE_CLIENTSIDE_CALLBACK.
 
         Arguments:
             request_items {list} -- Values of the search dropdown
-            normalization {str} -- Value of the normalization radio button group
+            plot_mode {str} -- Value of the plot mode radio button group
+            date_range {str} -- Value of the date range radio button group
+            alignment {str} -- Value of the alignment radio button group
+            projection_options {list} -- Values of the projections checklist
 
         Returns:
-            dict -- Data structure that updates the main-plot figure parameter
+            str -- JSON encoded data that updates the series-store data
         """
-        if request_items is None:
-            return _get_plot_dict()
-
-        logger.info('Search callback was trigger')
-        plot_data = []
-        for request_item in request_items:
-            logger.debug(f'Processing request item {request_item}')
-
-            (country, data_type) = request_item.split(':')
-            if data_type == 'recovered':
-                country_data = covid_data.get_recovered_bycountry(country)
-                graph_type = chart_recovered_type
-            elif data_type == 'dead':
-                country_data = covid_data.get_dead_bycountry(country)
-                graph_type = chart_dead_type
-            else:
-                country_data = covid_data.get_infected_bycountry(country)
-                graph_type = chart_infected_type
-
-
-            country_pop = population_data.get_total(country)
-
-            x = list(country_data.keys())
-            if normalization == 'per-1000':
-                y = list(v * 1000 / country_pop for v in country_data.values())
-            elif normalization == 'per-capita':
-                y = list(v / country_pop for v in country_data.values())
-            else:
-                y = list(country_data.values())
-
-            plot_data.append(
-                {
-                    'type': graph_type,
-                    if graph_type == 'sunburt':
-                        'z': 1
-
-                    'x': x,
-                    'y': y,
-                    'text': f'{country} ({data_type})',
-                    'name': f'{country} ({data_type})'
-                }
-            )
-        return _get_plot_dict(plot_data)
+        show_projections = 'show' in (projection_options or [])
+        if figure_cache is None:
+            return _get_series_store(
+                request_items, plot_mode, date_range, alignment,
+                show_projections)
+
+        cache_key = FigureCache.make_key(
+            covid_data.get_version(), request_items, plot_mode, date_range,
+            alignment, show_projections)
+        cached = figure_cache.get(cache_key)
+        if cached is not None:
+            logger.debug(f'Figure cache hit for {request_items}')
+            return cached.decode('utf-8')
+
+        store = _get_series_store(
+            request_items, plot_mode, date_range, alignment, show_projections)
+        figure_cache.put(cache_key, store.encode('utf-8'))
+        return store
+
+    app.clientside_callback(
+        FIGURE_CLIENTSIDE_CALLBACK,
+        Output('main-plot', 'figure'),
+        [
+            Input('series-store', 'data'),
+            Input('normalization-rb', 'value'),
+            Input('chart-infected-rb', 'value'),
+            Input('chart-dead-rb', 'value'),
+            Input('chart-recovered-rb', 'value'),
+        ]
+    )
+
+
+def _get_series_store(request_items: list, plot_mode: str,
+                      date_range: str = 'all', alignment: str = 'date',
+                      show_projections: bool = False):
+    """Retrieve the raw series of the selected items. Time series are
+    assembled from the JSON fragments encoded when the data was loaded.
+
+    Arguments:
+        request_items {list} -- Values of the search dropdown
+        plot_mode {str} -- Value of the plot mode radio button group
+
+    Keyword Arguments:
+        date_range {str} -- A key of DATE_RANGES (default: {'all'})
+        alignment {str} -- A key of ALIGNMENTS. Aligned series start on the
+                           day their country reached the threshold and
+                           ignore the date range (default: {'date'})
+        show_projections {bool} -- Add the precomputed projections of the
+                                   series as dashed traces (default: {False})
+
+    Returns:
+        str -- JSON encoded data that updates the series-store data
+    """
+    if plot_mode in RANKING_MODES:
+        return json.dumps(
+            {'figure': _get_ranking_plot_dict(request_items, plot_mode)})
+
+    if request_items is None:
+        return json.dumps({'figure': _get_plot_dict()})
+
+    logger.info('Search callback was trigger')
+    requests = [request_item.split(':') for request_item in request_items]
+    items = [(country, METRICS[data_type])
+             for (country, data_type) in requests]
+
+    x_title = None
+    if ALIGNMENTS.get(alignment) is None:
+        (first, stop) = _get_date_span(date_range)
+        batch = derived_metrics.get_encoded_batch(
+            items, first=first, stop=stop)
+    else:
+        (align_type, threshold, label) = ALIGNMENTS[alignment]
+        x_title = f'Days since {label}'
+        batch = _get_aligned_batch(items, align_type, threshold, label)
+
+    x = batch.dates
+    offsets = [0]
+    for length in batch.lengths:
+        offsets.append(offsets[-1] + length)
+    values_end = offsets[-1]
+
+    series = []
+    projected = []
+    for ((country, data_type), (_, metric), row) in \
+            zip(requests, items, batch.rows):
+        if row is None:
+            logger.warning(f'No data to plot for {country}:{data_type}')
+            continue
+
+        series.append(
+            {
+                'name': f'{country} ({data_type})',
+                'data_type': data_type,
+                'normalize': data_type != CFR,
+                'population': batch.populations[row],
+                'offset': offsets[row],
+                'length': batch.lengths[row],
+                'x_offset': 0
+            }
+        )
+
+        if not show_projections or projections is None or metric == CFR:
+            continue
+        projection = projections.get_projection(metric, country)
+        encoded = projections.get_encoded(metric, country)
+        if projection is None or batch.lengths[row] == 0:
+            continue
+
+        # The projection starts on the last observed value of the series
+        projected.append(encoded.get_window())
+        series.append(
+            {
+                'name': f'{country} ({data_type}) projection',
+                'data_type': data_type,
+                'normalize': True,
+                'population': batch.populations[row],
+                'offset': values_end,
+                'length': encoded.get_size(),
+                'x_offset': batch.lengths[row] - 1,
+                'projection': projection.model
+            }
+        )
+        values_end += encoded.get_size()
+
+    if projected:
+        # Extend the x axis over the projected days
+        if x_title is None:
+            x = ','.join(fragment for fragment in
+                         (x, projections.encoded_future_dates.get_window())
+                         if fragment)
+        else:
+            x = projections.encoded_days.get_window(
+                0, max(batch.lengths) + projections.days)
+
+    store = ''.join((
+        '{"title":"COVID-19 Data","x":[', x,
+        '],"series":', json.dumps(series),
+        ',"values":[', ','.join(
+            fragment for fragment in [batch.values] + projected if fragment),
+        ']'))
+    if x_title is not None:
+        store += ',"x_title":' + json.dumps(x_title)
+    return store + '}'
+
+
+def _get_aligned_batch(items: list, align_type: COVIDEnum, threshold: int,
+                       label: str):
+    """Retrieve the encoded series of the selected items starting on the day
+    their country reached a threshold
+
+    Arguments:
+        items {list} -- (country, metric) pairs
+        align_type {COVIDEnum} -- The type of data of the threshold
+        threshold {int} -- The cumulative value to reach
+        label {str} -- Description of the threshold
+
+    Returns:
+        EncodedBatch -- The encoded series with a row of None for the items
+                        of countries that never reached the threshold
+    """
+    starts = [covid_data.get_crossing(align_type, country, threshold)
+              for (country, _) in items]
+    aligned = [index for index, start in enumerate(starts)
+               if start is not None]
+    if len(aligned) < len(items):
+        logger.info(
+            f'{len(items) - len(aligned)} series did not reach the {label}')
+
+    batch = derived_metrics.get_encoded_batch(
+        [items[index] for index in aligned],
+        starts=[starts[index] for index in aligned])
+
+    rows = [None] * len(items)
+    for (index, row) in zip(aligned, batch.rows):
+        rows[index] = row
+    return batch._replace(rows=rows)
+
+
+def _get_date_span(date_range: str):
+    """Locate the trailing window of a date range on the shared date axis
+
+    Arguments:
+        date_range {str} -- A key of DATE_RANGES
+
+    Returns:
+        (first {int}, stop {int}) -- Slice bounds of the window on
+            COVIDData.get_dates()
+    """
+    days = DATE_RANGES.get(date_range)
+    dates = covid_data.get_dates()
+    if days is None or not dates:
+        return 0, len(dates)
+
+    start = date.fromisoformat(dates[-1]) - timedelta(days=days - 1)
+    return covid_data.get_date_span(start)
 
 
 def _get_plot_dict(data_points: list = []):
@@ -94,15 +345,89 @@ def _get_plot_dict(data_points: list = []):
     }
 
 
-def _set_data(input_covid_data: COVIDData, input_pop_data: PopulationData):
+def _get_ranking_plot_dict(request_items: list, plot_mode: str):
+    """Build a figure of the top ranked countries for each data type in the
+    search selection
+
+    Arguments:
+        request_items {list} -- Values of the search dropdown
+        plot_mode {str} -- A key of RANKING_MODES
+
+    Returns:
+        dict -- Data structure that updates the main-plot figure parameter
+    """
+    (metric, metric_label) = RANKING_MODES[plot_mode]
+
+    data_types = []
+    for request_item in request_items or []:
+        try:
+            data_type = COVIDEnum(request_item.split(':')[1])
+        except ValueError:
+            continue
+        if data_type not in data_types:
+            data_types.append(data_type)
+    if not data_types:
+        data_types = list(COVIDEnum)
+
+    plot_data = []
+    for data_type in data_types:
+        top = rankings.get_top(data_type, metric, RANKING_SIZE)
+        plot_data.append(
+            {
+                'type': 'bar',
+                'orientation': 'h',
+                'x': [value for _, value in reversed(top)],
+                'y': [country for country, _ in reversed(top)],
+                'name': f'{data_type.value} ({metric_label})'
+            }
+        )
+
+    plot_dict = _get_plot_dict(plot_data)
+    plot_dict['layout']['title'] = \
+        f'COVID-19 Top {RANKING_SIZE} Countries ({metric_label})'
+    return plot_dict
+
+
+def _set_data(input_covid_data: COVIDData, input_pop_data: PopulationData,
+              input_rankings: COVIDRankings = None,
+              input_derived_metrics: DerivedMetrics = None,
+              input_projections: Projections = None):
     """Pass data into the application to permit access to Dash components
 
     Arguments:
         input_covid_data {COVIDData} -- COVID-19 datasets
         input_pop_data {PopulationData} -- Population datasets
+
+    Keyword Arguments:
+        input_rankings {COVIDRankings} -- Cross-country rankings of the
+                                          COVID-19 datasets (default: {None})
+        input_derived_metrics {DerivedMetrics} -- Per-country series derived
+                                                  from the datasets
+                                                  (default: {None})
+        input_projections {Projections} -- Projections of the datasets or
+                                           None to disable them
+                                           (default: {None})
     """
     global covid_data
     global population_data
+    global rankings
+    global derived_metrics
+    global projections
 
     covid_data = input_covid_data
     population_data = input_pop_data
+    rankings = input_rankings
+    derived_metrics = input_derived_metrics
+    projections = input_projections
+
+
+def _set_figure_cache(input_figure_cache: FigureCache):
+    """Share the series-store payloads between worker processes
+
+    Arguments:
+        input_figure_cache {FigureCache} -- Cache of serialized payloads or
+                                            None to disable caching
+    """
+    global figure_cache
+
+    figure_cache = input_figure_cache
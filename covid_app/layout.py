@@ -41,6 +41,9 @@ def create_layout(app):
     )
     _populate_search(search_field)
 
+    logger.debug('Creating series Store')
+    series_store = dcc.Store(id='series-store')
+
     logger.debug('Creating main-plot Graph')
     main_plot = dcc.Graph(
         id='main-plot',
@@ -65,6 +68,7 @@ def create_layout(app):
         options=[
             {'label': 'None', 'value': 'none'},
             {'label': 'Per 1000 people', 'value': 'per-1000'},
+            {'label': 'Per 100k people', 'value': 'per-100k'},
             {'label': 'Per capita', 'value': 'per-capita'}
         ],
         value='none',
@@ -81,6 +85,102 @@ def create_layout(app):
 
     )
 
+    logger.debug('Creating plot mode radio buttons')
+    plot_mode_rb = dcc.RadioItems(
+        id='plot-mode-rb',
+        labelStyle={
+            'display': 'block'
+        },
+        options=[
+            {'label': 'Time series', 'value': 'timeseries'},
+            {'label': 'Top 10 by total', 'value': 'top-total'},
+            {'label': 'Top 10 by new this week', 'value': 'top-new-week'}
+        ],
+        value='timeseries',
+    )
+    plot_mode_fs = html.Fieldset(
+        style={
+            'display': 'inline-block'
+        },
+        children=[
+            html.Legend(children='Plot Mode'),
+            plot_mode_rb
+        ],
+        draggable=True,
+    )
+
+    logger.debug('Creating date range radio buttons')
+    date_range_rb = dcc.RadioItems(
+        id='date-range-rb',
+        labelStyle={
+            'display': 'block'
+        },
+        options=[
+            {'label': 'All dates', 'value': 'all'},
+            {'label': 'Last 90 days', 'value': '90'},
+            {'label': 'Last 30 days', 'value': '30'}
+        ],
+        value='all',
+    )
+    date_range_fs = html.Fieldset(
+        style={
+            'display': 'inline-block'
+        },
+        children=[
+            html.Legend(children='Date Range'),
+            date_range_rb
+        ],
+        draggable=True,
+    )
+
+    logger.debug('Creating alignment radio buttons')
+    alignment_rb = dcc.RadioItems(
+        id='alignment-rb',
+        labelStyle={
+            'display': 'block'
+        },
+        options=[
+            {'label': 'Date', 'value': 'date'},
+            {'label': 'Days since 100th case', 'value': 'infected:100'},
+            {'label': 'Days since 1000th case', 'value': 'infected:1000'},
+            {'label': 'Days since 10th death', 'value': 'dead:10'},
+            {'label': 'Days since 100th death', 'value': 'dead:100'}
+        ],
+        value='date',
+    )
+    alignment_fs = html.Fieldset(
+        style={
+            'display': 'inline-block'
+        },
+        children=[
+            html.Legend(children='Align On'),
+            alignment_rb
+        ],
+        draggable=True,
+    )
+
+    logger.debug('Creating projections checklist')
+    projections_cl = dcc.Checklist(
+        id='projections-cl',
+        labelStyle={
+            'display': 'block'
+        },
+        options=[
+            {'label': 'Show projections', 'value': 'show'}
+        ],
+        value=[],
+    )
+    projections_fs = html.Fieldset(
+        style={
+            'display': 'inline-block'
+        },
+        children=[
+            html.Legend(children='Projections'),
+            projections_cl
+        ],
+        draggable=True,
+    )
+
     logger.debug('Creating infected chart type radio buttons')
     chart_option_elems = []
     for data_type in ('infected', 'dead', 'recovered'):
@@ -111,8 +211,13 @@ def create_layout(app):
     page.children.append(page_title)
     page.children.append(app_description)
     page.children.append(search_field)
+    page.children.append(plot_mode_fs)
+    page.children.append(date_range_fs)
+    page.children.append(alignment_fs)
+    page.children.append(projections_fs)
     page.children.append(normalization_fs)
     page.children.extend(chart_option_elems)
+    page.children.append(series_store)
     page.children.append(main_plot)
 
     logger.info('Setting application layout')
@@ -136,6 +241,8 @@ def _populate_search(dropdown: dcc.Dropdown):
             {'label': f'{country} (Dead)', 'value': f'{country}:dead'})
         dropdown.options.append(
             {'label': f'{country} (Recovered)', 'value': f'{country}:recovered'})
+        dropdown.options.append(
+            {'label': f'{country} (Case fatality rate %)', 'value': f'{country}:cfr'})
 
     dropdown.value = ['Canada:infected', 'Canada:recovered', 'Canada:dead']
 
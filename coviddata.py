@@ -1,12 +1,23 @@
 import csv
+import hashlib
 import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from itertools import accumulate, chain
+from operator import sub
 from re import compile, Pattern
 from datetime import date
 from enum import Enum
 from typing import NamedTuple
 
+from datafile import open_data_file
+from storage import COVIDStorage, MemoryCOVIDStorage
+
 logger = logging.getLogger('coviddata')
 
+DATE_PATTERN = compile(r'\d{1,2}/\d{1,2}/\d{2,4}')
+
 
 class COVIDEnum(Enum):
     INFECTED = 'infected'
@@ -14,6 +25,15 @@ class COVIDEnum(Enum):
     RECOVERED = 'recovered'
 
 
+# Cumulative values whose first crossing is indexed for every country when
+# data is loaded, used to align series on the start of each outbreak
+CROSSING_THRESHOLDS = {
+    COVIDEnum.INFECTED: (100, 1000),
+    COVIDEnum.DEAD: (10, 100),
+    COVIDEnum.RECOVERED: (100,),
+}
+
+
 class DataFile(NamedTuple):
     data_type: COVIDEnum
     path: str
@@ -29,13 +49,36 @@ class COVIDDataParser(object):
         self.data_files.append(DataFile(COVIDEnum.DEAD, dead_csv))
         self.skip_first = skip_first
 
-    def parse(self):
-        covid_data = COVIDData()
+    def parse(self, storage: COVIDStorage = None):
+        """Parse the csv files and return the COVID-19 data as an object
+
+        Keyword Arguments:
+            storage {COVIDStorage} -- Backend that stores the parsed data.
+                Keep as None to store the data in memory (default: {None})
+
+        Returns:
+            COVIDData -- COVID-19 data encapsulation object
+        """
+        covid_data = COVIDData(storage)
+        with covid_data.bulk_load():
+            self._parse_files(covid_data)
+
+        return covid_data
+
+    def _parse_files(self, covid_data):
         country_re_brackets = compile(r'\(.+\)')
         for data_file in self.data_files:
-            with open(data_file.path, buffering=16384) as f:
+            with open_data_file(data_file.path, buffering=16384) as f:
                 csv_reader = csv.DictReader(
                     f, delimiter=',', quotechar='"', restkey='extradata')
+                # Resolve the date columns once per file rather than per row
+                date_keys = []
+                date_ordinals = []
+                for key in csv_reader.fieldnames or []:
+                    parsed_date = COVIDDataParser._parse_date(key)
+                    if parsed_date is not None:
+                        date_keys.append(key)
+                        date_ordinals.append(parsed_date.toordinal())
                 line_count = 0
                 for row in csv_reader:
                     line_count += 1
@@ -54,23 +97,19 @@ class COVIDDataParser(object):
                     if country.endswith(', The'):
                         country = country[:-5]
 
-                    for key, str_value in row.items():
-                        date = COVIDDataParser._parse_date(key)
-                        if date is None:
-                            continue
+                    values = []
+                    for key in date_keys:
+                        str_value = row[key]
                         if str_value is None or str_value == '':
-                            value = 0
+                            values.append(0)
                         else:
-                            value = int(str_value)
-                        covid_data.add_data(data_file.data_type,
-                                            country, date, value)
-
-        return covid_data
+                            values.append(int(str_value))
+                    covid_data.add_series(data_file.data_type, country,
+                                          date_ordinals, values)
 
     @staticmethod
     def _parse_date(str_date: str):
-        date_pattern = compile(r'\d{1,2}/\d{1,2}/\d{2,4}')
-        if date_pattern.fullmatch(str_date) is None:
+        if DATE_PATTERN.fullmatch(str_date) is None:
             return None
 
         (month, day, year) = list(map(int, str_date.split('/')))
@@ -84,60 +123,113 @@ class COVIDDataParser(object):
 
 
 class COVIDData(dict):
-    """[summary]
+    """COVID-19 data encapsulation class
 
-    Arguments:
-        object {[type]} -- [description]
+    Dates are stored as integer day ordinals (date.toordinal()) on a single
+    sorted axis shared by every series. Each country and data type holds an
+    array of values aligned with that axis. ISO date strings are only
+    produced in one batch by get_dates().
     """
 
-    def __init__(self):
+    def __init__(self, storage: COVIDStorage = None):
+        """Initialize a COVIDData object
+
+        Keyword Arguments:
+            storage {COVIDStorage} -- Backend that stores the data. Keep as
+                None to store the data in memory (default: {None})
+        """
         super().__init__()
-        self.data = {}
+        if storage is None:
+            storage = MemoryCOVIDStorage()
+        self.storage = storage
+        self._iso_dates = None
+        self._version = None
+        self._crossings = None
 
     def add_data(self, data_type: COVIDEnum, country: str, date: date, val: float):
         if country == '':
             raise ValueError('Country cannot be empty')
         try:
-            str_date = COVIDData._format_date(date)
+            ordinal = date.toordinal()
         except AttributeError as e:
             raise ValueError('Date must be a valid date object')
 
-        if not (val >= 0 and val < 999999):
-            raise ValueError('Value must be an integer between 0 and 999999')
+        COVIDData._validate_value(val)
+
+        self._on_change()
+        self.storage.add_series(data_type, country, [ordinal], [val])
 
-        self._add_data_bydate(data_type, country, str_date, val)
+    def add_series(self, data_type: COVIDEnum, country: str, ordinals: list, values: list):
+        """Add a series of values for a country in a single call
 
-    def _add_country(self, country: str):
-        self.data[country] = {
-            COVIDEnum.INFECTED: {},
-            COVIDEnum.RECOVERED: {},
-            COVIDEnum.DEAD: {},
-            'total': {
-                COVIDEnum.INFECTED: 0,
-                COVIDEnum.RECOVERED: 0,
-                COVIDEnum.DEAD: 0
-            }
-        }
+        Arguments:
+            data_type {COVIDEnum} -- The type of data being provided
+            country {str} -- The country name
+            ordinals {list} -- Date ordinals (date.toordinal()) of the values
+            values {list} -- The values, one per date ordinal
+        """
+        if country == '':
+            raise ValueError('Country cannot be empty')
+        if len(ordinals) != len(values):
+            raise ValueError('Series must have one value per date')
 
-    def _add_date(self, country: str, date: str):
-        self.data[country][COVIDEnum.INFECTED][date] = 0
-        self.data[country][COVIDEnum.RECOVERED][date] = 0
-        self.data[country][COVIDEnum.DEAD][date] = 0
+        for val in values:
+            COVIDData._validate_value(val)
 
-    def _add_data_bydate(self, data_type: COVIDEnum, country: str, date: str, value: int):
-        if country not in self.data:
-            self._add_country(country)
+        self._on_change()
+        self.storage.add_series(data_type, country, ordinals, values)
 
-        if date not in self.data[country][data_type]:
-            self._add_date(country, date)
+    @contextmanager
+    def bulk_load(self):
+        """Context manager that groups the data added within it into a single
+        storage transaction
+        """
+        with self.storage.bulk_load():
+            yield self
+        self._on_change()
+        self.build_crossings()
+
+    def _on_change(self):
+        self._iso_dates = None
+        self._version = None
+        self._crossings = None
+
+    def build_crossings(self):
+        """Index the dates on which every country reached the
+        CROSSING_THRESHOLDS. Called by bulk_load(), and should be called
+        after opening a storage that already holds data so the index is not
+        built by the first request.
+        """
+        logger.info('Indexing COVID-19 threshold crossings')
+        crossings = {}
+        for data_type, thresholds in CROSSING_THRESHOLDS.items():
+            tables = {threshold: {} for threshold in thresholds}
+            for country in self.get_countries():
+                positions = COVIDData._find_crossings(
+                    self.storage.get_series(data_type, country), thresholds)
+                for threshold, position in zip(thresholds, positions):
+                    if position is not None:
+                        tables[threshold][country] = position
+            for threshold in thresholds:
+                crossings[(data_type, threshold)] = tables[threshold]
+        self._crossings = crossings
 
-        # Add data from new record to existing value for that date
-        # Existing value could be from records separted by province
-        self.data[country][data_type][date] += value
+    @staticmethod
+    def _find_crossings(series: array, thresholds: tuple):
+        """Find the first position at which a cumulative series reached each
+        threshold
 
-        # Set the total to the latest record we have for that counrty
-        latest_date = sorted(list(self.data[country][data_type])).pop()
-        self.data[country]['total'][data_type] = self.data[country][data_type][latest_date]
+        Returns:
+            list -- Positions, None for the thresholds never reached
+        """
+        # Cumulative values can be corrected downward, the running maximum
+        # is sorted so crossings can be found by bisection
+        peaks = array('l', accumulate(series, max))
+        positions = []
+        for threshold in thresholds:
+            position = bisect_left(peaks, threshold)
+            positions.append(position if position < len(peaks) else None)
+        return positions
 
     def get_countries(self):
         """Get countries that have data
@@ -145,7 +237,35 @@ class COVIDData(dict):
         Returns:
             list -- Countries that have data
         """
-        return list(self.data.keys())
+        return self.storage.get_countries()
+
+    def get_dates(self):
+        """Get the ISO formatted dates of the shared date axis
+
+        Returns:
+            list -- Dates as YYYY-MM-DD strings aligned with get_series()
+        """
+        if self._iso_dates is None:
+            self._iso_dates = [date.fromordinal(ordinal).isoformat()
+                               for ordinal in self.storage.get_dates()]
+        return self._iso_dates
+
+    def get_version(self):
+        """Get a digest of the data that changes whenever the data changes
+
+        Returns:
+            str -- Hex digest of the dates and values of every series
+        """
+        if self._version is None:
+            digest = hashlib.sha1(
+                array('l', self.storage.get_dates()).tobytes())
+            for country in sorted(self.get_countries()):
+                digest.update(country.encode('utf-8'))
+                for data_type in COVIDEnum:
+                    digest.update(
+                        self.storage.get_series(data_type, country).tobytes())
+            self._version = digest.hexdigest()
+        return self._version
 
     def get_total_infected(self, country: str):
         return self.get_total(COVIDEnum.INFECTED, country)
@@ -157,7 +277,13 @@ class COVIDData(dict):
         return self.get_total(COVIDEnum.RECOVERED, country)
 
     def get_total(self, data_type: COVIDEnum, country: str):
-        return self.data[country]['total'][data_type]
+        # The total is the value of the latest date we have for that country
+        series = self.storage.get_series(data_type, country)
+        if series is None:
+            raise KeyError(country)
+        if not series:
+            return 0
+        return series[-1]
 
     def get_infected_bydate(self, country: str, date: date, cumulative: bool = True):
         return self.get_bydate(COVIDEnum.INFECTED, country, date, cumulative)
@@ -169,18 +295,19 @@ class COVIDData(dict):
         return self.get_bydate(COVIDEnum.RECOVERED, country, date, cumulative)
 
     def get_bydate(self, data_type: COVIDEnum, country: str, date: date, cumulative: bool = True):
-        str_date = COVIDData._format_date(date)
-        if str_date not in self.data[country][data_type]:
-            return None
+        series = self.storage.get_series(data_type, country)
+        if series is None:
+            raise KeyError(country)
 
-        if cumulative:
-            return self.data[country][data_type][str_date]
+        position = self.storage.get_date_position(date.toordinal())
+        if position is None:
+            return None
+        if cumulative or position == 0:
+            return series[position]
 
-        dates = sorted(list(self.data[country][data_type].keys()))
         # Subtractive data is calculated by subtracting from the target date's
         # cumulative value the previous date's cumulative value
-        prev_day = dates(dates.index(date) - 1)
-        return self.data[country][data_type][str_date] - self.data[country][data_type][prev_day]
+        return series[position] - series[position - 1]
 
     def get_infected_bycountry(self, country, cumulative: bool = True):
         return self.get_bycountry(COVIDEnum.INFECTED, country, cumulative)
@@ -192,24 +319,131 @@ class COVIDData(dict):
         return self.get_bycountry(COVIDEnum.RECOVERED, country, cumulative)
 
     def get_bycountry(self, data_type: COVIDEnum, country: str, cumulative: bool = True):
-        if country not in self.data:
+        series = self.get_series(data_type, country, cumulative)
+        if series is None:
             return None
 
-        if cumulative:
-            return self.data[country][data_type]
+        return dict(zip(self.get_dates(), series))
+
+    def get_series(self, data_type: COVIDEnum, country: str, cumulative: bool = True):
+        """Get the values of a country aligned with the shared date axis
+
+        Arguments:
+            data_type {COVIDEnum} -- The type of data requested
+            country {str} -- The country name
+
+        Keyword Arguments:
+            cumulative {bool} -- Return cumulative values rather than daily
+                                 changes (default: {True})
+
+        Returns:
+            array -- Values aligned with get_dates() or None if the country
+                     has no data
+        """
+        series = self.storage.get_series(data_type, country)
+        if series is None or cumulative:
+            return series
 
-        # Sort the keys (dates) because we can't rely on their order
-        dates = sorted(list(self.data[country][data_type].keys()))
         # Subtractive data must be calculated from the existing cumulative data
-        sub_data = self.data[country][data_type].copy()
-        prev_day_total = 0
-        for day in dates:
-            prev_value = sub_data[day]
-            sub_data[day] -= prev_day_total
-            prev_day_total = prev_value
+        return COVIDData._to_daily(series)
+
+    def get_date_span(self, start: date = None, end: date = None):
+        """Locate a date range on the shared date axis by binary search
+
+        Keyword Arguments:
+            start {date} -- First date of the range, None for the earliest
+                            date (default: {None})
+            end {date} -- Last date of the range (included), None for the
+                          latest date (default: {None})
 
-        return sub_data
+        Returns:
+            (first {int}, stop {int}) -- Slice bounds of the range on
+                get_dates(), empty if no date falls within the range
+        """
+        ordinals = self.storage.get_dates()
+        first = 0
+        stop = len(ordinals)
+        if start is not None:
+            first = bisect_left(ordinals, start.toordinal())
+        if end is not None:
+            stop = bisect_right(ordinals, end.toordinal())
+        return first, max(first, stop)
+
+    def get_infected_range(self, country: str, start: date = None, end: date = None, cumulative: bool = True):
+        return self.get_range(COVIDEnum.INFECTED, country, start, end, cumulative)
+
+    def get_dead_range(self, country: str, start: date = None, end: date = None, cumulative: bool = True):
+        return self.get_range(COVIDEnum.DEAD, country, start, end, cumulative)
+
+    def get_recovered_range(self, country: str, start: date = None, end: date = None, cumulative: bool = True):
+        return self.get_range(COVIDEnum.RECOVERED, country, start, end, cumulative)
+
+    def get_range(self, data_type: COVIDEnum, country: str, start: date = None,
+                  end: date = None, cumulative: bool = True):
+        """Get the values of a country within a date range
+
+        Arguments:
+            data_type {COVIDEnum} -- The type of data requested
+            country {str} -- The country name
+
+        Keyword Arguments:
+            start {date} -- First date of the range, None for the earliest
+                            date (default: {None})
+            end {date} -- Last date of the range (included), None for the
+                          latest date (default: {None})
+            cumulative {bool} -- Return cumulative values rather than daily
+                                 changes (default: {True})
+
+        Returns:
+            (dates {list}, values {array}) -- The ISO formatted dates of the
+                range and the values aligned with them, or None if the
+                country has no data
+        """
+        (first, stop) = self.get_date_span(start, end)
+
+        # The daily change of the first date needs the cumulative value of
+        # the date before it
+        lead = 1 if not cumulative and first > 0 else 0
+        series = self.storage.get_series(
+            data_type, country, first - lead, stop)
+        if series is None:
+            return None
+
+        if not cumulative:
+            series = COVIDData._to_daily(series)[lead:]
+        return self.get_dates()[first:stop], series
+
+    def get_crossing(self, data_type: COVIDEnum, country: str, threshold: int):
+        """Get the first date on which the cumulative value of a country
+        reached a threshold
+
+        Arguments:
+            data_type {COVIDEnum} -- The type of data
+            country {str} -- The country name
+            threshold {int} -- The value to reach, answered from the index
+                               for the CROSSING_THRESHOLDS
+
+        Returns:
+            int -- Position of the date on get_dates() or None if the
+                   threshold was never reached
+        """
+        if self._crossings is None:
+            self.build_crossings()
+
+        table = self._crossings.get((data_type, threshold))
+        if table is not None:
+            return table.get(country)
+
+        series = self.storage.get_series(data_type, country)
+        if series is None:
+            return None
+        return COVIDData._find_crossings(series, (threshold,))[0]
 
     @staticmethod
-    def _format_date(date: date):
-        return str(date.year) + '-' + str(date.month).zfill(2) + '-' + str(date.day).zfill(2)
+    def _to_daily(series: array):
+        return array('l', map(sub, series, chain((0,), series)))
+
+    @staticmethod
+    def _validate_value(val: float):
+        if not (val >= 0 and val < 999999):
+            raise ValueError('Value must be an integer between 0 and 999999')
@@ -0,0 +1,53 @@
+import bz2
+import gzip
+import logging
+import lzma
+import os.path
+
+logger = logging.getLogger(__name__)
+
+# Streaming decompressors for the compressed file types that can be parsed
+COMPRESSED_OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+
+def open_data_file(path: str, buffering: int = -1, newline: str = None):
+    """Open a data file for reading as text, decompressing it on the fly if
+    its extension is one of COMPRESSED_OPENERS
+
+    Arguments:
+        path {str} -- Path to a plain or compressed data file
+
+    Keyword Arguments:
+        buffering {int} -- Buffer size used for uncompressed files
+                           (default: {-1})
+        newline {str} -- Newline mode passed to the text reader
+                         (default: {None})
+
+    Returns:
+        TextIO -- A file object that yields the decompressed text
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in COMPRESSED_OPENERS:
+        logger.debug(f'Opening {path} with a {extension} decompressor')
+        return COMPRESSED_OPENERS[extension](path, 'rt', newline=newline)
+
+    return open(path, buffering=buffering, newline=newline)
+
+
+def strip_compression_suffix(path: str):
+    """Remove the compression extension from a file path
+
+    Arguments:
+        path {str} -- A file path
+
+    Returns:
+        str -- The path without a trailing COMPRESSED_OPENERS extension
+    """
+    (root, extension) = os.path.splitext(path)
+    if extension.lower() in COMPRESSED_OPENERS:
+        return root
+    return path
@@ -1,10 +1,17 @@
+import asyncio
+import gzip
 import logging
 import os.path
+import random
+import struct
 
 import urllib3
 from urllib3.util.url import parse_url
-from urllib3.exceptions import MaxRetryError
+from urllib3.exceptions import HTTPError
 import tempfile
+from urllib.parse import unquote
+
+from datasource import DataSource
 
 logger = logging.getLogger(__name__)
 
@@ -12,10 +19,12 @@ logger = logging.getLogger(__name__)
 class RemoteDataFile():
     """Encapsulation of a remote data file"""
 
-    def __init__(self, url, download_dir: str, file_name: str):
+    def __init__(self, url, download_dir: str, file_name: str,
+                 compress: bool = False):
         super().__init__()
         self.download_dir = download_dir
         self.file_name = file_name
+        self.compress = compress
         try:
             self.url = parse_url(url)
         except ValueError as e:
@@ -26,15 +35,82 @@ class RemoteDataFile():
     def get_url(self):
         return self.url.url
 
+    def get_host(self):
+        return self.url.host
+
+    def get_remote_name(self):
+        """Get the file name of the remote file found in its URL"""
+        return unquote(os.path.basename(self.url.path or ''))
+
     def get_download_path(self):
-        return os.path.join(self.download_dir, self.file_name)
+        path = os.path.join(self.download_dir, self.file_name)
+        if self.compress:
+            path += '.gz'
+        return path
+
+    def get_partial_path(self, encoded: bool = False):
+        """Get the path of the file that holds an incomplete download
+
+        Keyword Arguments:
+            encoded {bool} -- The download is a gzip content-encoded response
+                              (default: {False})
+        """
+        path = os.path.join(self.download_dir, self.file_name)
+        if encoded:
+            return path + '.gz.part'
+        return path + '.part'
+
+    def get_validator_path(self, encoded: bool = False):
+        """Get the path of the file that holds the ETag or Last-Modified
+        header of the response an incomplete download was started from
+
+        Keyword Arguments:
+            encoded {bool} -- See get_partial_path() (default: {False})
+        """
+        return self.get_partial_path(encoded) + '.validator'
+
+
+class RetryableError(Exception):
+    """A download failure that may succeed if the download is retried"""
+    pass
 
 
 class DataDownload():
-    def __init__(self, default_dir=tempfile.mkdtemp()):
+    def __init__(self, default_dir=tempfile.mkdtemp(), max_retries: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 per_host_limit: int = 2, timeout: float = 30.0,
+                 compress: bool = True, source: DataSource = None):
+        """Initialize a DataDownload object
+
+        Keyword Arguments:
+            default_dir {str} -- Directory where files are downloaded
+            max_retries {int} -- Number of times a failed download is retried
+                                 (default: {5})
+            backoff_base {float} -- Seconds to wait before the first retry.
+                                    Doubles after every attempt (default: {1.0})
+            backoff_max {float} -- Maximum seconds to wait between retries
+                                   (default: {60.0})
+            per_host_limit {int} -- Maximum concurrent downloads from the same
+                                    host (default: {2})
+            timeout {float} -- Socket timeout in seconds (default: {30.0})
+            compress {bool} -- Store the downloaded files gzip compressed.
+                               Responses that are already gzip encoded are
+                               stored as received (default: {True})
+            source {DataSource} -- Local source the files are read from
+                                   instead of downloading them. Keep as None
+                                   to download the files (default: {None})
+        """
         super().__init__()
         self.default_dir = default_dir
         self.remote_data_files = []
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.per_host_limit = per_host_limit
+        self.compress = compress
+        self.source = source
+        self.http = urllib3.PoolManager(
+            retries=False, timeout=urllib3.Timeout(connect=timeout, read=timeout))
 
     def add_download(self, url: str, file_name: str,
                      download_dir: str = None):
@@ -51,7 +127,8 @@ class DataDownload():
         """
         if download_dir is None:
             download_dir = self.default_dir
-        remote_data_file = RemoteDataFile(url, download_dir, file_name)
+        remote_data_file = RemoteDataFile(url, download_dir, file_name,
+                                          self.compress)
         self.remote_data_files.append(remote_data_file)
 
     def download(self, remote_file: RemoteDataFile):
@@ -67,55 +144,330 @@ class DataDownload():
                 succeeded. The file_path is None and success if False if the
                 download fails.
         """
-        if not os.path.exists(remote_file.download_dir):
-            logger.debug(
-                f'Creating download folder {remote_file.download_dir}')
-            os.mkdir(remote_file.download_dir)
+        if self.source is not None:
+            return self.source.fetch(remote_file)
+        return asyncio.run(self.download_async(remote_file))
+
+    async def download_async(self, remote_file: RemoteDataFile,
+                             semaphore: asyncio.Semaphore = None):
+        """Download a remote file, retrying failed attempts with an
+        exponential backoff. Interrupted downloads are resumed from the
+        partially downloaded file.
+
+        Arguments:
+            remote_file {RemoteDataFile} -- The RemoteDataFile object that
+                defines the URL and destination location
+
+        Keyword Arguments:
+            semaphore {asyncio.Semaphore} -- Limits the concurrent downloads
+                from the host of the file (default: {None})
+
+        Returns:
+            (file_path {str}, success {boolean}) -- See download()
+        """
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host_limit)
 
+        loop = asyncio.get_running_loop()
         dest_file_path = remote_file.get_download_path()
-        dest_file_size = 0
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                delay = self._get_backoff(attempt)
+                logger.info(
+                    f'Retrying download of {remote_file.get_url()} in '
+                    f'{delay:.1f}s (attempt {attempt + 1} of {self.max_retries + 1})')
+                await asyncio.sleep(delay)
+
+            try:
+                async with semaphore:
+                    await loop.run_in_executor(None, self._fetch, remote_file)
+                return dest_file_path, True
+            except (RetryableError, HTTPError, OSError) as e:
+                logger.warning(
+                    f'Failed to download {remote_file.get_url()}: {e}')
+            except ValueError as e:
+                logger.error(
+                    f'Failed to download {remote_file.get_url()}: {e}')
+                break
+
+        logger.error(f'Failed to download {remote_file.get_url()}')
         if os.path.exists(dest_file_path):
-            dest_file_size = os.path.getsize(dest_file_path)
-            logger.debug(
-                f'File {dest_file_path} already exists with size {dest_file_size}')
+            logger.warning(
+                f'Using previously downloaded file {dest_file_path}')
+            return dest_file_path, True
 
-        http = urllib3.PoolManager()
-        try:
-            req = http.request('GET', remote_file.get_url(),
-                               preload_content=False,)
-        except MaxRetryError as e:
-            logger.error(f'Failed to download {remote_file.get_url()}')
-            e.reason = f'Failed to download {remote_file.get_url()}'
-            return None, False
-
-        if 'Content-Length' not in req.headers or \
-                dest_file_size != int(req.headers['Content-Length']):
-            logger.debug(f'Writing remote data file to disk: {dest_file_path}')
-            with open(dest_file_path, 'wb') as out:
-                while True:
-                    data = req.read(16384)
-                    if not data:
-                        break
-                    out.write(data)
-            req.release_conn()
-        else:
-            logger.info(
-                f'Skipping file download because it is the same file on disk: {remote_file.get_url()}')
-
-        return dest_file_path, True
+        return None, False
 
     def download_all(self):
-        """Download all files in the download list
+        """Download all files in the download list concurrently
         
         Returns:
             file_paths {list{str}} -- A list of the downloaded file paths on
-                disk and a boolean indicating if the download succeeded. The
-                file_path is None and success if False if the download fails.
+                disk. Files that failed to download are omitted.
         """        
-        data_files = []
+        if self.source is not None:
+            data_files = []
+            for remote_data_file in self.remote_data_files:
+                file_path, succeeded = self.source.fetch(remote_data_file)
+                if succeeded:
+                    data_files.append(file_path)
+            return data_files
+
+        return asyncio.run(self.download_all_async())
+
+    async def download_all_async(self):
+        """Coroutine that downloads all files in the download list
+
+        Returns:
+            file_paths {list{str}} -- See download_all()
+        """
+        semaphores = {}
+        tasks = []
         for remote_data_file in self.remote_data_files:
-            file_path, succeeded = self.download(remote_data_file)
+            host = remote_data_file.get_host()
+            if host not in semaphores:
+                semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+            tasks.append(self.download_async(
+                remote_data_file, semaphores[host]))
+
+        data_files = []
+        for file_path, succeeded in await asyncio.gather(*tasks):
             if succeeded:
                 data_files.append(file_path)
 
         return data_files
+
+    def _get_backoff(self, attempt: int):
+        # Full jitter keeps workers that failed together from retrying together
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    def _fetch(self, remote_file: RemoteDataFile):
+        """Perform one download attempt into the partial file and move it to
+        its final location once it is complete. Runs in an executor thread.
+
+        Responses that are not gzip encoded are compressed while they are
+        written when the file is stored compressed, so the disk never holds
+        the uncompressed file. An interrupted attempt closes the gzip member
+        it was writing and records the number of response bytes it holds,
+        and the next attempt appends a new member from there. A compressed
+        partial file left by a process that was killed has no such record
+        and is downloaded again.
+        """
+        os.makedirs(remote_file.download_dir, exist_ok=True)
+
+        dest_file_path = remote_file.get_download_path()
+
+        # A partial download keeps the content encoding it was started with
+        encoded = remote_file.compress and \
+            os.path.exists(remote_file.get_partial_path(True))
+        compressing = remote_file.compress and not encoded
+        part_file_path = remote_file.get_partial_path(encoded)
+        validator_path = remote_file.get_validator_path(encoded)
+        offset = 0
+        validator = None
+        if os.path.exists(part_file_path):
+            (validator, offset) = DataDownload._get_resume_offset(
+                part_file_path, validator_path, compressing)
+            if offset == 0:
+                # The partial file cannot be matched with the remote file
+                logger.debug(f'Discarding {part_file_path}')
+                DataDownload._remove_partial(part_file_path, validator_path)
+
+        headers = {'Accept-Encoding': 'identity'}
+        if remote_file.compress and (encoded or offset == 0):
+            headers['Accept-Encoding'] = 'gzip'
+        if offset > 0:
+            logger.debug(f'Resuming {dest_file_path} from byte {offset}')
+            headers['Range'] = f'bytes={offset}-'
+            # The server sends the whole file instead of the range when the
+            # remote file changed since the partial file was started
+            headers['If-Range'] = validator
+
+        req = self.http.request('GET', remote_file.get_url(), headers=headers,
+                                preload_content=False,
+                                decode_content=not remote_file.compress)
+        complete = False
+        try:
+            if req.status == 416:
+                # The partial file is no longer valid for the remote file
+                DataDownload._remove_partial(part_file_path, validator_path)
+                raise RetryableError('Requested range not satisfiable')
+            if req.status >= 500 or req.status == 429:
+                raise RetryableError(f'HTTP status {req.status}')
+            if req.status not in (200, 206):
+                raise ValueError(f'HTTP status {req.status}')
+
+            response_encoded = remote_file.compress and \
+                req.headers.get('Content-Encoding', '').lower() == 'gzip'
+            if req.status == 206:
+                content_range = req.headers.get('Content-Range', '')
+                if not content_range.startswith(f'bytes {offset}-') or \
+                        response_encoded != encoded:
+                    DataDownload._remove_partial(part_file_path, validator_path)
+                    raise RetryableError(
+                        f'Unexpected content range {content_range}')
+                # Servers that ignore If-Range still identify the version
+                # of the range they sent
+                response_validator = DataDownload._get_validator(req.headers)
+                if response_validator is not None and \
+                        response_validator != validator:
+                    DataDownload._remove_partial(part_file_path, validator_path)
+                    raise RetryableError(
+                        f'Remote file changed from {validator} to {response_validator}')
+                mode = 'ab'
+                expected_size = content_range.rpartition('/')[2]
+            else:
+                DataDownload._remove_partial(part_file_path, validator_path)
+                compressing = remote_file.compress and not response_encoded
+                part_file_path = remote_file.get_partial_path(response_encoded)
+                validator_path = remote_file.get_validator_path(
+                    response_encoded)
+                mode = 'wb'
+                offset = 0
+                expected_size = req.headers.get('Content-Length', '*')
+                if expected_size.isdigit() and \
+                        os.path.exists(dest_file_path) and \
+                        DataDownload._get_stored_size(remote_file, response_encoded) == int(expected_size):
+                    logger.info(
+                        f'Skipping file download because it is the same file on disk: {remote_file.get_url()}')
+                    return
+
+                validator = DataDownload._get_validator(req.headers)
+                DataDownload._write_validator(validator_path, validator)
+
+            logger.debug(f'Writing remote data file to disk: {part_file_path}')
+            with open(part_file_path, mode) as out:
+                sink = out
+                if compressing:
+                    sink = gzip.GzipFile(fileobj=out, mode='wb',
+                                         compresslevel=6)
+                try:
+                    while True:
+                        data = req.read(16384)
+                        if not data:
+                            break
+                        sink.write(data)
+                        offset += len(data)
+                finally:
+                    if compressing:
+                        # Complete the gzip member so that another one can
+                        # be appended by the next attempt
+                        sink.close()
+                        out.flush()
+                        DataDownload._write_validator(
+                            validator_path, validator, (offset, out.tell()))
+            complete = True
+        finally:
+            # A connection with an unread body cannot be reused
+            if complete:
+                req.release_conn()
+            else:
+                req.close()
+
+        if expected_size.isdigit() and offset < int(expected_size):
+            raise RetryableError(
+                f'Connection closed after {offset} of {expected_size} bytes')
+
+        os.replace(part_file_path, dest_file_path)
+        if os.path.exists(validator_path):
+            os.remove(validator_path)
+
+    @staticmethod
+    def _get_validator(headers):
+        """Get the validator of a response that If-Range accepts: a strong
+        ETag or else the Last-Modified date
+
+        Returns:
+            str -- The validator or None if the response has none
+        """
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        return headers.get('Last-Modified') or None
+
+    @staticmethod
+    def _get_resume_offset(part_file_path: str, validator_path: str,
+                           compressed: bool):
+        """Get the position in the response that a partial file can be
+        resumed from. A compressed partial file is truncated to the end of
+        the last gzip member that was completed.
+
+        Returns:
+            (validator {str}, offset {int}) -- The validator of the response
+                the partial file was started from and the number of response
+                bytes it holds. The offset is 0 if the partial file cannot be
+                resumed
+        """
+        (validator, checkpoint) = DataDownload._read_validator(validator_path)
+        part_file_size = os.path.getsize(part_file_path)
+        if validator is None or (checkpoint is not None) != compressed:
+            return None, 0
+        if not compressed:
+            return validator, part_file_size
+
+        (offset, stored_size) = checkpoint
+        if stored_size > part_file_size:
+            return None, 0
+        if stored_size < part_file_size:
+            os.truncate(part_file_path, stored_size)
+        return validator, offset
+
+    @staticmethod
+    def _read_validator(validator_path: str):
+        """Read the validator of a partial file and, for a compressed one, the
+        (response bytes, stored bytes) checkpoint of its last gzip member
+
+        Returns:
+            (validator {str}, checkpoint {tuple}) -- None for missing values
+        """
+        if not os.path.exists(validator_path):
+            return None, None
+        with open(validator_path, 'r') as f:
+            lines = f.read().splitlines()
+        validator = lines[0].strip() if lines else None
+        checkpoint = None
+        if len(lines) > 1:
+            try:
+                (offset, stored_size) = map(int, lines[1].split())
+            except ValueError:
+                return None, None
+            checkpoint = (offset, stored_size)
+        return validator or None, checkpoint
+
+    @staticmethod
+    def _write_validator(validator_path: str, validator: str,
+                         checkpoint: tuple = None):
+        if validator is None:
+            # Without a validator the partial file will not be resumed
+            if os.path.exists(validator_path):
+                os.remove(validator_path)
+            return
+        with open(validator_path, 'w') as f:
+            f.write(validator + '\n')
+            if checkpoint is not None:
+                f.write('%d %d\n' % checkpoint)
+
+    @staticmethod
+    def _remove_partial(part_file_path: str, validator_path: str):
+        """Remove a partial file and the validator it was started with"""
+        for path in (part_file_path, validator_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def _get_stored_size(remote_file: RemoteDataFile, encoded: bool):
+        """Get the size of the stored file as it would be sent by the server
+
+        The size of a file compressed locally is read from the gzip trailer,
+        which holds the uncompressed size modulo 2^32. A resumed download is
+        made of several gzip members and the trailer of the last one only
+        holds its own size, so such a file is never considered the same.
+        """
+        dest_file_path = remote_file.get_download_path()
+        if not remote_file.compress or encoded:
+            return os.path.getsize(dest_file_path)
+
+        with open(dest_file_path, 'rb') as f:
+            f.seek(-4, os.SEEK_END)
+            return struct.unpack('<I', f.read(4))[0]
@@ -0,0 +1,229 @@
+import logging
+import mmap
+import os
+import os.path
+import shutil
+import struct
+import tarfile
+import zipfile
+
+from datafile import COMPRESSED_OPENERS
+
+logger = logging.getLogger(__name__)
+
+# Size and layout of the local file header that precedes zip member data
+ZIP_LOCAL_HEADER = struct.Struct('<4s5H3I2H')
+
+
+class DataSource(object):
+    """Source of data files that replaces the network downloads of
+    DataDownload
+    """
+
+    def fetch(self, remote_file):
+        """Make a data file available on local disk
+
+        Arguments:
+            remote_file {RemoteDataFile} -- The data file to retrieve
+
+        Returns:
+            (file_path {str}, success {boolean}) -- A tuple of the local file
+                path and a boolean indicating if the file was found. The
+                file_path is None and success is False if it was not found.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _get_candidate_names(remote_file):
+        """Names a snapshot of a remote file may have, either its destination
+        file name or the name it has upstream, optionally compressed
+        """
+        names = []
+        for base_name in (remote_file.file_name, remote_file.get_remote_name()):
+            if not base_name or base_name in names:
+                continue
+            names.append(base_name)
+            names.extend(base_name + extension
+                         for extension in COMPRESSED_OPENERS)
+        return names
+
+    @staticmethod
+    def _get_local_name(remote_file, found_name: str):
+        # Keep the destination file name so callers can recognize the file,
+        # along with the compression extension of the snapshot
+        for extension in COMPRESSED_OPENERS:
+            if found_name.endswith(extension):
+                return remote_file.file_name + extension
+        return remote_file.file_name
+
+
+class MirrorDirectorySource(DataSource):
+    """Reads data files from a local directory of pinned snapshots"""
+
+    def __init__(self, mirror_dir: str):
+        """Initialize a MirrorDirectorySource object
+
+        Arguments:
+            mirror_dir {str} -- Directory holding the snapshots
+        """
+        super().__init__()
+        if not os.path.isdir(mirror_dir):
+            raise ValueError(f'Mirror directory {mirror_dir} does not exist')
+        self.mirror_dir = mirror_dir
+
+    def fetch(self, remote_file):
+        for name in DataSource._get_candidate_names(remote_file):
+            path = os.path.join(self.mirror_dir, name)
+            if not os.path.isfile(path):
+                continue
+
+            local_name = DataSource._get_local_name(remote_file, name)
+            if name == local_name:
+                logger.info(f'Using mirrored file {path}')
+                return path, True
+
+            # Link the snapshot under its destination name instead of
+            # copying it
+            os.makedirs(remote_file.download_dir, exist_ok=True)
+            link_path = os.path.join(remote_file.download_dir, local_name)
+            if os.path.lexists(link_path):
+                os.remove(link_path)
+            os.symlink(os.path.abspath(path), link_path)
+            logger.info(f'Using mirrored file {path} as {link_path}')
+            return link_path, True
+
+        logger.error(
+            f'No mirrored copy of {remote_file.get_url()} in {self.mirror_dir}')
+        return None, False
+
+
+class ArchiveSource(DataSource):
+    """Extracts data files from a zip or tar archive of pinned snapshots
+
+    Members that are stored uncompressed are copied straight out of a memory
+    map of the archive. Other members are decompressed as a stream.
+    """
+
+    def __init__(self, archive_path: str):
+        """Initialize an ArchiveSource object
+
+        Arguments:
+            archive_path {str} -- Path of a zip or tar archive
+        """
+        super().__init__()
+        if not os.path.isfile(archive_path):
+            raise ValueError(f'Mirror archive {archive_path} does not exist')
+        if not zipfile.is_zipfile(archive_path) and \
+                not tarfile.is_tarfile(archive_path):
+            raise ValueError(f'{archive_path} is not a zip or tar archive')
+        self.archive_path = archive_path
+
+    def fetch(self, remote_file):
+        candidates = DataSource._get_candidate_names(remote_file)
+        try:
+            if zipfile.is_zipfile(self.archive_path):
+                return self._fetch_zip(remote_file, candidates)
+            return self._fetch_tar(remote_file, candidates)
+        except (OSError, tarfile.TarError, zipfile.BadZipFile) as e:
+            logger.error(
+                f'Failed to extract {remote_file.file_name} from {self.archive_path}: {e}')
+            return None, False
+
+    def _fetch_zip(self, remote_file, candidates: list):
+        with zipfile.ZipFile(self.archive_path) as archive:
+            member = ArchiveSource._find_member(
+                archive.infolist(), lambda info: info.filename, candidates)
+            if member is None:
+                return self._not_found(remote_file)
+
+            dest_path = self._get_dest_path(remote_file, member.filename)
+            if member.compress_type == zipfile.ZIP_STORED:
+                with open(self.archive_path, 'rb') as f:
+                    f.seek(member.header_offset)
+                    header = ZIP_LOCAL_HEADER.unpack(
+                        f.read(ZIP_LOCAL_HEADER.size))
+                offset = member.header_offset + ZIP_LOCAL_HEADER.size + \
+                    header[-2] + header[-1]
+                self._copy_mapped(offset, member.file_size, dest_path)
+            else:
+                with archive.open(member) as src:
+                    self._copy_stream(src, dest_path)
+
+        return dest_path, True
+
+    def _fetch_tar(self, remote_file, candidates: list):
+        # Member offsets only point into the file of an uncompressed tar
+        try:
+            archive = tarfile.open(self.archive_path, 'r:')
+            mapped = True
+        except tarfile.ReadError:
+            archive = tarfile.open(self.archive_path, 'r:*')
+            mapped = False
+
+        with archive:
+            member = ArchiveSource._find_member(
+                [info for info in archive.getmembers() if info.isfile()],
+                lambda info: info.name, candidates)
+            if member is None:
+                return self._not_found(remote_file)
+
+            dest_path = self._get_dest_path(remote_file, member.name)
+            if mapped:
+                self._copy_mapped(member.offset_data, member.size, dest_path)
+            else:
+                self._copy_stream(archive.extractfile(member), dest_path)
+
+        return dest_path, True
+
+    @staticmethod
+    def _find_member(members: list, get_name, candidates: list):
+        by_name = {os.path.basename(get_name(member)): member
+                   for member in members}
+        for name in candidates:
+            if name in by_name:
+                return by_name[name]
+        return None
+
+    def _get_dest_path(self, remote_file, member_name: str):
+        os.makedirs(remote_file.download_dir, exist_ok=True)
+        local_name = DataSource._get_local_name(
+            remote_file, os.path.basename(member_name))
+        logger.info(
+            f'Extracting {member_name} from {self.archive_path} as {local_name}')
+        return os.path.join(remote_file.download_dir, local_name)
+
+    def _copy_mapped(self, offset: int, size: int, dest_path: str):
+        part_path = dest_path + '.part'
+        with open(self.archive_path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, \
+                memoryview(mapped) as view, \
+                view[offset:offset + size] as member, \
+                open(part_path, 'wb') as out:
+            out.write(member)
+        os.replace(part_path, dest_path)
+
+    @staticmethod
+    def _copy_stream(src, dest_path: str):
+        part_path = dest_path + '.part'
+        with open(part_path, 'wb') as out:
+            shutil.copyfileobj(src, out, 131072)
+        os.replace(part_path, dest_path)
+
+    def _not_found(self, remote_file):
+        logger.error(
+            f'No mirrored copy of {remote_file.get_url()} in {self.archive_path}')
+        return None, False
+
+
+def create_source(mirror_path: str):
+    """Create the data source that reads from a mirror directory or archive
+
+    Arguments:
+        mirror_path {str} -- Path of a directory or of a zip or tar archive
+
+    Returns:
+        DataSource -- The source of the data files
+    """
+    if os.path.isdir(mirror_path):
+        return MirrorDirectorySource(mirror_path)
+    return ArchiveSource(mirror_path)
@@ -0,0 +1,173 @@
+import logging
+from array import array
+from typing import NamedTuple
+
+from coviddata import COVIDData, COVIDEnum
+from encodedseries import EncodedSeries
+from populationdata import PopulationData
+
+logger = logging.getLogger(__name__)
+
+
+# Metric accepted in place of a COVIDEnum for the case fatality rate series
+CFR = 'cfr'
+
+
+class EncodedBatch(NamedTuple):
+    """Series of several countries and metrics on a shared date axis,
+    already JSON encoded
+
+    dates and values are the comma separated contents of JSON arrays, with
+    the rows of values stored one after the other. lengths holds the number
+    of values in each row.
+    """
+    dates: str
+    keys: list
+    populations: list
+    rows: list
+    lengths: list
+    values: str
+
+
+class DerivedMetrics(object):
+    """Table of per-country series derived from the COVID-19 and population
+    datasets
+
+    The population denominator and the case fatality rate series of every
+    country are resolved once by refresh(), which should be called whenever
+    new data is loaded. The raw and case fatality rate series and the date
+    axis are also JSON encoded by refresh() so responses can be assembled
+    from the encoded fragments. Normalized values are computed by the client
+    from the population denominators.
+    """
+
+    def __init__(self, covid_data: COVIDData, population_data: PopulationData):
+        """Initialize a DerivedMetrics object and build the table
+
+        Arguments:
+            covid_data {COVIDData} -- COVID-19 datasets
+            population_data {PopulationData} -- Population datasets
+        """
+        super().__init__()
+        self.covid_data = covid_data
+        self.population_data = population_data
+        self.populations = {}
+        self.cfr = {}
+        self.encoded = {}
+        self.encoded_dates = None
+        self.encoded_days = None
+        self.refresh()
+
+    def refresh(self):
+        """Rebuild the derived series from the datasets"""
+        logger.info('Building derived COVID-19 metrics table')
+        self.populations = {}
+        self.cfr = {}
+        self.encoded = {}
+        for country in self.covid_data.get_countries():
+            population = self.population_data.get_total(country)
+            if population <= 0:
+                logger.debug(f'No population data found for {country}')
+                population = None
+            self.populations[country] = population
+
+            series = {data_type: self.covid_data.get_series(data_type, country)
+                      for data_type in COVIDEnum}
+            self.cfr[country] = array('d', (
+                dead_value * 100 / infected_value if infected_value > 0 else 0.0
+                for infected_value, dead_value in zip(
+                    series[COVIDEnum.INFECTED], series[COVIDEnum.DEAD])))
+
+            for data_type in COVIDEnum:
+                self.encoded[(country, data_type)] = EncodedSeries.from_values(
+                    series[data_type])
+            self.encoded[(country, CFR)] = EncodedSeries.from_values(
+                self.cfr[country])
+
+        self.encoded_dates = EncodedSeries.from_values(
+            self.covid_data.get_dates())
+        self.encoded_days = EncodedSeries.from_values(
+            range(len(self.covid_data.get_dates())))
+
+    def get_population(self, country: str):
+        """Get the population denominator used for a country
+
+        Returns:
+            int -- Population total or None if it could not be resolved
+        """
+        return self.populations.get(country)
+
+    def get_cfr(self, country: str):
+        """Get the case fatality rate series of a country, as the percentage
+        of confirmed cases that have died on each date
+
+        Returns:
+            array -- The series or None if the country has no data
+        """
+        return self.cfr.get(country)
+
+    def get_encoded_batch(self, items: list, first: int = 0, stop: int = None,
+                          starts: list = None):
+        """Get the JSON encoded series of several countries and metrics by
+        concatenating the fragments encoded by refresh(). Only raw series
+        are encoded, normalized values must be computed by the client.
+
+        Arguments:
+            items {list} -- (country, metric) pairs where metric is a
+                            COVIDEnum or CFR
+
+        Keyword Arguments:
+            first {int} -- First position on COVIDData.get_dates()
+                           (default: {0})
+            stop {int} -- Position after the last one on
+                          COVIDData.get_dates(), None for the end
+                          (default: {None})
+            starts {list} -- First position of each pair, overriding first.
+                             The dates are then replaced by the number of
+                             days since the first position (default: {None})
+
+        Returns:
+            EncodedBatch -- The encoded series of the pairs that have data
+        """
+        keys = []
+        fragments = []
+        rows = []
+        lengths = []
+        if starts is None:
+            # Every series is aligned with the date axis, so the window
+            # bounds are resolved once for the whole batch
+            size = self.encoded_dates.get_size()
+            (first, stop, _) = slice(first, stop).indices(size)
+            length = max(0, stop - first)
+            for item in items:
+                encoded = self.encoded.get(item)
+                if encoded is None:
+                    rows.append(None)
+                    continue
+                rows.append(len(keys))
+                keys.append(item)
+                if length == size:
+                    fragments.append(encoded.text)
+                elif length:
+                    fragments.append(encoded.text[
+                        encoded.offsets[first]:encoded.offsets[stop] - 1])
+            lengths = [length] * len(keys)
+            dates = self.encoded_dates.get_window(first, stop)
+        else:
+            for (item, start) in zip(items, starts):
+                encoded = self.encoded.get(item)
+                if encoded is None:
+                    rows.append(None)
+                    continue
+                rows.append(len(keys))
+                keys.append(item)
+                window = range(*slice(start, stop).indices(encoded.get_size()))
+                lengths.append(len(window))
+                if window:
+                    fragments.append(encoded.get_window(start, stop))
+            dates = self.encoded_days.get_window(0, max(lengths, default=0))
+
+        populations = self.populations
+        return EncodedBatch(
+            dates, keys, [populations.get(country) for (country, _) in keys],
+            rows, lengths, ','.join(fragments))
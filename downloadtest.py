@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import gzip
+import logging
+import os.path
+import sys
+import tempfile
+import threading
+
+from dataloader import DataDownload
+
+logging.basicConfig(
+    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+    level=logging.INFO)
+logger = logging.getLogger('downloadtest')
+
+FILE_NAME = 'data.csv'
+FILE_SIZE = 1 << 20
+
+
+def main():
+    opts = get_config()
+    if opts.verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/{FILE_NAME}'
+
+    failures = 0
+    try:
+        for scenario in SCENARIOS:
+            for compress in (False, True):
+                name = f'{scenario.__name__} (compress={compress})'
+                reset_server(server)
+                with tempfile.TemporaryDirectory() as download_dir:
+                    try:
+                        scenario(server, url, download_dir, compress)
+                    except AssertionError as e:
+                        failures += 1
+                        logger.error(f'FAIL {name}: {e}')
+                    else:
+                        logger.info(f'PASS {name}')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    sys.exit(1 if failures else 0)
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serves the file held by the server and supports Range and If-Range
+    requests. The server attributes control its behavior:
+
+    content {bytes} -- Contents of the file
+    etag {str} -- ETag of the file, None to send no validator
+    honor_if_range {bool} -- Send the range even when If-Range does not
+                             match, like a server that ignores the header
+    fail_after {int} -- Close the connection after sending this number of
+                        bytes of the next response body, None to send it all
+    requests {list} -- (Range, If-Range) headers of every request received
+    """
+
+    def do_GET(self):
+        server = self.server
+        content = server.content
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        server.requests.append((range_header, if_range))
+
+        first = 0
+        if range_header is not None and \
+                (if_range is None or if_range == server.etag or
+                 not server.honor_if_range):
+            first = int(range_header[len('bytes='):].rstrip('-'))
+        if first >= len(content) > 0:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{len(content)}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = content[first:]
+        self.send_response(206 if first else 200)
+        if first:
+            self.send_header(
+                'Content-Range', f'bytes {first}-{len(content) - 1}/{len(content)}')
+        if server.etag is not None:
+            self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if server.fail_after is not None:
+            body = body[:server.fail_after]
+            server.fail_after = None
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def reset_server(server, version: int = 1):
+    """Serve a new version of the file with the default behavior"""
+    server.content = b''.join(
+        f'{version},{line},{line * version}\n'.encode()
+        for line in range(FILE_SIZE // 16))
+    server.etag = f'"v{version}"'
+    server.honor_if_range = True
+    server.fail_after = None
+    server.requests = []
+
+
+def get_downloader(download_dir: str, compress: bool, max_retries: int = 1):
+    return DataDownload(default_dir=download_dir, max_retries=max_retries,
+                        backoff_base=0, compress=compress)
+
+
+def download(server, url: str, download_dir: str, compress: bool,
+             max_retries: int = 1):
+    """Download the file and return its contents or None if it failed"""
+    downloader = get_downloader(download_dir, compress, max_retries)
+    downloader.add_download(url, FILE_NAME)
+    (file_path, succeeded) = downloader.download(
+        downloader.remote_data_files[0])
+    if not succeeded:
+        return None
+    opener = gzip.open if compress else open
+    with opener(file_path, 'rb') as f:
+        return f.read()
+
+
+def interrupt(server, url: str, download_dir: str, compress: bool):
+    """Leave a partial download of the current version of the file"""
+    server.fail_after = len(server.content) // 2
+    content = download(server, url, download_dir, compress, max_retries=0)
+    assert content is None, 'the interrupted download succeeded'
+    parts = [name for name in os.listdir(download_dir)
+             if name.endswith('.part')]
+    assert parts, 'no partial file was kept'
+    if compress:
+        # Compressed files are stored gzipped while they are downloaded
+        with gzip.open(os.path.join(download_dir, parts[0]), 'rb') as f:
+            stored = f.read()
+        assert stored and server.content.startswith(stored), \
+            'the partial file does not hold a gzipped part of the file'
+    return os.path.join(download_dir, parts[0])
+
+
+def test_resume(server, url: str, download_dir: str, compress: bool):
+    interrupt(server, url, download_dir, compress)
+    content = download(server, url, download_dir, compress)
+    assert content == server.content, 'the resumed file differs'
+    (range_header, if_range) = server.requests[-1]
+    assert range_header is not None, 'the download was not resumed'
+    assert if_range == server.etag, f'If-Range was {if_range}'
+    assert not [name for name in os.listdir(download_dir)
+                if name.endswith(('.part', '.validator'))], \
+        'partial files were left behind'
+
+
+def test_unfinished_member(server, url: str, download_dir: str,
+                           compress: bool):
+    if not compress:
+        # Uncompressed partial files are made of whole response bytes
+        return
+    part_path = interrupt(server, url, download_dir, compress)
+    # Bytes written by a process killed during the next attempt
+    with open(part_path, 'ab') as f:
+        f.write(gzip.compress(server.content[:4096])[:100])
+    content = download(server, url, download_dir, compress)
+    assert content == server.content, 'the resumed file differs'
+    assert server.requests[-1][0] is not None, 'the download was not resumed'
+
+
+def test_changed_remote_file(server, url: str, download_dir: str,
+                             compress: bool):
+    interrupt(server, url, download_dir, compress)
+    reset_server(server, 2)
+    content = download(server, url, download_dir, compress)
+    assert content == server.content, 'the partial file was resumed'
+
+
+def test_ignored_if_range(server, url: str, download_dir: str,
+                          compress: bool):
+    interrupt(server, url, download_dir, compress)
+    reset_server(server, 2)
+    server.honor_if_range = False
+    content = download(server, url, download_dir, compress)
+    assert content == server.content, 'the partial file was resumed'
+
+
+def test_no_validator(server, url: str, download_dir: str, compress: bool):
+    server.etag = None
+    interrupt(server, url, download_dir, compress)
+    reset_server(server, 2)
+    server.etag = None
+    content = download(server, url, download_dir, compress)
+    assert content == server.content, 'the partial file was resumed'
+    assert server.requests[-1] == (None, None), \
+        'a partial file without a validator was resumed'
+
+
+SCENARIOS = (test_resume, test_unfinished_member, test_changed_remote_file,
+             test_ignored_if_range, test_no_validator)
+
+
+def get_config():
+    parser = argparse.ArgumentParser(
+        description='Run the data downloader against a local server that '
+                    'interrupts downloads and changes the remote file')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Log the requests and the downloader debug messages')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
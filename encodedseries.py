@@ -0,0 +1,51 @@
+import json
+from array import array
+from itertools import accumulate, chain
+from typing import NamedTuple
+
+
+class EncodedSeries(NamedTuple):
+    """A series of values encoded once as the comma separated contents of a
+    JSON array
+
+    offsets holds the position in text where each value starts, plus one
+    past the end of the text, so the encoding of any contiguous window of
+    values is a single string slice.
+    """
+    text: str
+    offsets: array
+
+    @classmethod
+    def from_values(cls, values):
+        """Encode a series of JSON serializable values
+
+        Arguments:
+            values {iterable} -- Numbers or strings without commas
+
+        Returns:
+            EncodedSeries -- The encoded series
+        """
+        text = json.dumps(list(values), separators=(',', ':'))[1:-1]
+        if not text:
+            return cls(text, array('l', (0,)))
+
+        # Every value is followed by a comma except the last one
+        lengths = (len(part) + 1 for part in text.split(','))
+        return cls(text, array('l', chain((0,), accumulate(lengths))))
+
+    def get_size(self):
+        """Get the number of encoded values"""
+        return len(self.offsets) - 1
+
+    def get_window(self, first: int = 0, stop: int = None):
+        """Get the encoding of the values from position first to stop
+        (excluded)
+
+        Returns:
+            str -- Comma separated JSON encoded values, empty if the window
+                   holds no value
+        """
+        (first, stop, _) = slice(first, stop).indices(self.get_size())
+        if first >= stop:
+            return ''
+        return self.text[self.offsets[first]:self.offsets[stop] - 1]
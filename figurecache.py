@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+
+from sqlitedatabase import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+# Milliseconds a request waits for the lock of the database before it gives
+# up on the cache
+BUSY_TIMEOUT_MS = 100
+# Milliseconds a worker waits for the lock while the schema is created
+SCHEMA_TIMEOUT_MS = 30000
+
+
+class FigureCache(object):
+    """Key-value store of serialized figure payloads shared by every worker
+    process through a SQLite database on local disk
+
+    The database runs in write-ahead logging mode so readers never wait on
+    writers or take locks that block them. The total size of the entries is
+    kept in a one-row table updated by every write, and entries are evicted
+    oldest first once it exceeds max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024):
+        """Initialize a FigureCache object
+
+        Arguments:
+            path {str} -- Path of the SQLite database file
+
+        Keyword Arguments:
+            max_bytes {int} -- Maximum total size of the cached payloads
+                               (default: {64 MiB})
+        """
+        super().__init__()
+        if max_bytes < 1:
+            raise ValueError('Cache size must be a positive integer')
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.database = SQLiteDatabase(path, timeout=BUSY_TIMEOUT_MS / 1000)
+        self._create_schema()
+
+    @staticmethod
+    def make_key(*parts):
+        """Build a cache key from JSON serializable parts such as the
+        dataset version and the request parameters
+
+        Returns:
+            str -- Hex digest identifying the parts
+        """
+        encoded = json.dumps(parts, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        """Get a cached payload
+
+        Arguments:
+            key {str} -- A key built by make_key()
+
+        Returns:
+            bytes -- The payload or None if it is not cached
+        """
+        try:
+            row = self._get_connection().execute(
+                'SELECT value FROM figures WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f'Failed to read from the figure cache: {e}')
+            return None
+
+        if row is None:
+            return None
+        return bytes(row[0])
+
+    def put(self, key: str, value: bytes):
+        """Store a payload and evict the oldest entries if the cache is full
+
+        Arguments:
+            key {str} -- A key built by make_key()
+            value {bytes} -- The serialized payload
+        """
+        if len(value) > self.max_bytes:
+            return
+
+        try:
+            connection = self._get_connection()
+            with connection:
+                # Take the write lock first, the size of a replaced entry is
+                # read within the transaction
+                connection.execute('BEGIN IMMEDIATE')
+                row = connection.execute(
+                    'SELECT size FROM figures WHERE key = ?', (key,)).fetchone()
+                connection.execute(
+                    'INSERT OR REPLACE INTO figures (key, value, size, created) '
+                    'VALUES (?, ?, ?, ?)',
+                    (key, value, len(value), time.time()))
+                total = self._add_to_total(
+                    connection, len(value) - (row[0] if row else 0))
+                if total > self.max_bytes:
+                    self._evict(connection, total)
+        except sqlite3.Error as e:
+            logger.warning(f'Failed to write to the figure cache: {e}')
+
+    def clear(self):
+        """Remove every cached payload, for example after new data is loaded"""
+        try:
+            connection = self._get_connection()
+            with connection:
+                connection.execute('DELETE FROM figures')
+                connection.execute('UPDATE figure_stats SET total = 0')
+        except sqlite3.Error as e:
+            logger.warning(f'Failed to clear the figure cache: {e}')
+
+    @staticmethod
+    def _add_to_total(connection: sqlite3.Connection, delta: int):
+        """Update the total size of the entries within a write transaction
+
+        Returns:
+            int -- The new total size
+        """
+        connection.execute(
+            'UPDATE figure_stats SET total = total + ?', (delta,))
+        (total,) = connection.execute(
+            'SELECT total FROM figure_stats').fetchone()
+        return total
+
+    def _evict(self, connection: sqlite3.Connection, total: int):
+        # Only the oldest entries needed to get back under the limit are read
+        excess = total - self.max_bytes
+        evicted = 0
+        cursor = connection.execute(
+            'SELECT key, size FROM figures ORDER BY created')
+        keys = []
+        for (key, size) in cursor:
+            if evicted >= excess:
+                break
+            keys.append((key,))
+            evicted += size
+        cursor.close()
+        connection.executemany('DELETE FROM figures WHERE key = ?', keys)
+        FigureCache._add_to_total(connection, -evicted)
+        logger.debug(f'Evicted {evicted} bytes from the figure cache')
+
+    def _create_schema(self):
+        # Workers starting together wait for the one creating the schema
+        self.database.create((
+            'CREATE TABLE IF NOT EXISTS figures ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+            'size INTEGER NOT NULL, created REAL NOT NULL)',
+            'CREATE INDEX IF NOT EXISTS figures_created '
+            'ON figures (created)',
+            'CREATE TABLE IF NOT EXISTS figure_stats ('
+            'id INTEGER PRIMARY KEY CHECK (id = 0), '
+            'total INTEGER NOT NULL)',
+            'INSERT OR IGNORE INTO figure_stats (id, total) VALUES (0, 0)',
+        ), timeout=SCHEMA_TIMEOUT_MS / 1000)
+
+    def _get_connection(self):
+        return self.database.get_connection()
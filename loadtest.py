@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os.path
+import random
+import subprocess
+import sys
+import time
+
+import urllib3
+from urllib3.exceptions import HTTPError
+
+logging.basicConfig(
+    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+    level=logging.INFO)
+logger = logging.getLogger('loadtest')
+
+CALLBACK_PATH = '/_dash-update-component'
+
+
+def main():
+    opts = get_config()
+
+    server = None
+    if opts.start_server:
+        server = start_server(opts)
+
+    try:
+        http = urllib3.PoolManager(maxsize=int(opts.concurrency))
+        callback = get_search_callback(http, opts.url)
+        requests = generate_requests(
+            callback, int(opts.requests), int(opts.max_items), int(opts.seed),
+            float(opts.default_share))
+
+        logger.info(
+            f'Sending {len(requests)} requests with {opts.concurrency} clients')
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=int(opts.concurrency)) as executor:
+            results = list(executor.map(
+                lambda body: send_request(http, opts.url, body), requests))
+        elapsed = time.perf_counter() - started
+
+        print_report(results, elapsed, len(set(requests)))
+    finally:
+        if server is not None:
+            logger.info('Stopping the local server')
+            server.terminate()
+            server.wait()
+
+
+def start_server(opts):
+    """Start run.py in a subprocess and wait until it serves requests
+
+    Returns:
+        subprocess.Popen -- The server process
+    """
+    run_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run.py')
+    server_args = [arg for arg in opts.server_args if arg != '--']
+    if opts.no_figure_cache and '--no-figure-cache' not in server_args:
+        server_args.append('--no-figure-cache')
+    command = [sys.executable, run_py] + server_args
+    logger.info(f'Starting local server: {" ".join(command)}')
+    server = subprocess.Popen(command)
+
+    http = urllib3.PoolManager()
+    deadline = time.monotonic() + float(opts.startup_timeout)
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError('The local server exited during startup')
+        try:
+            if http.request('GET', opts.url + '/', retries=False).status == 200:
+                return server
+        except HTTPError:
+            pass
+        time.sleep(1)
+
+    server.terminate()
+    raise RuntimeError('Timed out waiting for the local server')
+
+
+def get_search_callback(http, url: str):
+    """Find the server-side callback driven by the search field and the
+    initial values of its inputs in the application layout
+
+    Returns:
+        dict -- The callback dependency, the initial input values and the
+                search field options
+    """
+    dependencies = json.loads(
+        http.request('GET', url + '/_dash-dependencies').data)
+    layout = json.loads(http.request('GET', url + '/_dash-layout').data)
+
+    callback = None
+    for dependency in dependencies:
+        if dependency.get('clientside_function'):
+            continue
+        if {'id': 'search-field', 'property': 'value'} in dependency['inputs']:
+            callback = dependency
+            break
+    if callback is None:
+        raise RuntimeError('No server-side callback uses the search field')
+
+    props = {}
+    _collect_props(layout, props)
+
+    return {
+        'dependency': callback,
+        'props': props,
+        'options': [option['value']
+                    for option in props['search-field'].get('options', [])],
+    }
+
+
+def _collect_props(component, props: dict):
+    if isinstance(component, list):
+        for child in component:
+            _collect_props(child, props)
+        return
+    if not isinstance(component, dict) or 'props' not in component:
+        return
+
+    component_props = component['props']
+    if 'id' in component_props:
+        props[component_props['id']] = component_props
+    _collect_props(component_props.get('children'), props)
+
+
+def generate_requests(callback: dict, count: int, max_items: int, seed: int,
+                      default_share: float = 1 / 3):
+    """Generate callback request bodies with realistic search selections.
+    A share of the requests use the default selection of the layout and the
+    others a random selection of one to max_items items. Repeated requests
+    are answered from the figure cache of the server when it is enabled.
+
+    Returns:
+        list -- JSON encoded request bodies
+    """
+    rng = random.Random(seed)
+    dependency = callback['dependency']
+    props = callback['props']
+    default_selection = props['search-field'].get('value') or []
+    (output_id, output_property) = dependency['output'].rsplit('.', 1)
+
+    requests = []
+    for _ in range(count):
+        if rng.random() < default_share or not callback['options']:
+            selection = list(default_selection)
+        else:
+            selection = rng.sample(
+                callback['options'],
+                rng.randint(1, min(max_items, len(callback['options']))))
+
+        inputs = []
+        for dep_input in dependency['inputs']:
+            if dep_input['id'] == 'search-field':
+                value = selection
+            else:
+                value = props.get(dep_input['id'], {}).get(dep_input['property'])
+            inputs.append(dict(dep_input, value=value))
+
+        requests.append(json.dumps({
+            'output': dependency['output'],
+            'outputs': {'id': output_id, 'property': output_property},
+            'inputs': inputs,
+            'state': [],
+            'changedPropIds': ['search-field.value'],
+        }).encode('utf-8'))
+
+    return requests
+
+
+def send_request(http, url: str, body: bytes):
+    """Send a callback request
+
+    Returns:
+        (latency {float}, success {boolean}) -- The latency in seconds and a
+            boolean indicating if the server answered successfully
+    """
+    started = time.perf_counter()
+    try:
+        response = http.request(
+            'POST', url + CALLBACK_PATH, body=body,
+            headers={'Content-Type': 'application/json'}, retries=False)
+        succeeded = response.status == 200
+    except HTTPError:
+        succeeded = False
+    return time.perf_counter() - started, succeeded
+
+
+def print_report(results: list, elapsed: float, distinct: int):
+    latencies = sorted(latency for latency, succeeded in results if succeeded)
+    errors = len(results) - len(latencies)
+
+    print(f'Requests:   {len(results)}')
+    print(f'Distinct:   {distinct}')
+    print(f'Errors:     {errors}')
+    print(f'Duration:   {elapsed:.2f} s')
+    print(f'Throughput: {len(latencies) / elapsed:.1f} req/s')
+    if latencies:
+        for percentile in (50, 95, 99):
+            print(f'p{percentile}:        '
+                  f'{_percentile(latencies, percentile) * 1000:.1f} ms')
+
+
+def _percentile(sorted_values: list, percentile: float):
+    # Nearest-rank percentile
+    rank = max(1, -(-len(sorted_values) * percentile // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def get_config():
+    '''
+    Defines the command line parameters and returns the parameters passed to the script
+
+    Returns:
+        argparse.args -- An object containing the parsed command line parameters
+    '''
+    parser = argparse.ArgumentParser(
+        prog='loadtest.py',
+        description="Load tests the COVID-19 plotter callback endpoint"
+    )
+
+    parser.add_argument(
+        "-u", "--url",
+        default="http://127.0.0.1:8080",
+        help="Base URL of the server under test"
+    )
+
+    parser.add_argument(
+        "-c", "--concurrency",
+        default=4,
+        help="Number of concurrent clients"
+    )
+
+    parser.add_argument(
+        "-n", "--requests",
+        default=1000,
+        help="Total number of requests to send"
+    )
+
+    parser.add_argument(
+        "-m", "--max-items",
+        default=6,
+        help="Maximum number of items in a search selection"
+    )
+
+    parser.add_argument(
+        "--seed",
+        default=0,
+        help="Random seed of the generated selections"
+    )
+
+    parser.add_argument(
+        "--default-share",
+        default=1 / 3,
+        help="Share of the requests that use the default selection of the layout"
+    )
+
+    parser.add_argument(
+        "--no-figure-cache",
+        action="store_true",
+        help="Start the server with --no-figure-cache so every request computes its figure"
+    )
+
+    parser.add_argument(
+        "--start-server",
+        action="store_true",
+        help="Start run.py locally for the duration of the test"
+    )
+
+    parser.add_argument(
+        "--startup-timeout",
+        default=300,
+        help="Seconds to wait for the started server"
+    )
+
+    parser.add_argument(
+        "server_args",
+        nargs=argparse.REMAINDER,
+        help="Options passed to run.py by --start-server, after --"
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import logging
+import resource
+import sys
+import time
+import tracemalloc
+from array import array
+from contextlib import contextmanager
+from enum import Enum
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+
+logger = logging.getLogger(__name__)
+
+# Objects shared by the whole process that are never attributed to a
+# structure
+SKIPPED_TYPES = (type, ModuleType, FunctionType, BuiltinFunctionType,
+                 MethodType, Enum, logging.Logger)
+SCALAR_TYPES = (str, bytes, bytearray, int, float, complex, bool, type(None))
+NUMBER_TYPES = (int, float)
+
+# Traced memory allocated by each loading stage, in the order they ran
+stages = []
+
+
+def start_tracing(frames: int = 1):
+    """Start tracing memory allocations so that the loading stages and the
+    allocation sites can be reported
+
+    Keyword Arguments:
+        frames {int} -- Number of frames stored per allocation (default: {1})
+    """
+    if not tracemalloc.is_tracing():
+        logger.info('Tracing memory allocations')
+        tracemalloc.start(frames)
+
+
+@contextmanager
+def stage(name: str):
+    """Context manager that records the traced memory allocated and still
+    held by the code run within it. Nothing is recorded when allocations are
+    not traced.
+
+    Arguments:
+        name {str} -- Name of the stage in the report
+    """
+    if not tracemalloc.is_tracing():
+        yield
+        return
+
+    (before, _) = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    yield
+    (after, _) = tracemalloc.get_traced_memory()
+    stages.append((name, after - before, time.perf_counter() - started))
+
+
+def deep_sizeof(obj, seen: set = None):
+    """Walk an object graph and add up the size of every object reachable
+    from it
+
+    Arguments:
+        obj {object} -- Root of the object graph
+
+    Keyword Arguments:
+        seen {set} -- Ids of objects already counted, which are skipped.
+                      Share it between calls to attribute shared objects to
+                      the first root only (default: {None})
+
+    Returns:
+        (size {int}, values {int}) -- The size in bytes and the number of
+            numeric values held in arrays, dictionary values and sequences
+    """
+    if seen is None:
+        seen = set()
+
+    size = 0
+    values = 0
+    pending = [obj]
+    while pending:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, SKIPPED_TYPES):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+
+        if isinstance(item, SCALAR_TYPES):
+            continue
+        if isinstance(item, array):
+            values += len(item)
+            continue
+
+        if isinstance(item, dict):
+            children = list(item.values())
+            pending.extend(item.keys())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            children = list(item)
+        else:
+            children = []
+
+        # Attributes of objects, including those of container subclasses
+        if hasattr(item, '__dict__'):
+            pending.append(item.__dict__)
+        for slot in getattr(type(item), '__slots__', ()):
+            if isinstance(slot, str) and hasattr(item, slot):
+                children.append(getattr(item, slot))
+
+        # Numbers are counted where they are referenced because small
+        # integers are shared objects
+        values += sum(1 for child in children
+                      if isinstance(child, NUMBER_TYPES)
+                      and not isinstance(child, bool))
+        pending.extend(children)
+
+    return size, values
+
+
+class MemoryReport(object):
+    """Report of the memory held by the loaded data structures
+
+    Structures are measured in the order they are added. Objects reachable
+    from several structures are attributed to the first one only. Traced
+    allocations are captured when the report is created, before the
+    structures are walked.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.seen = set()
+        self.rows = []
+        self.traced = None
+        self.snapshot = None
+        if tracemalloc.is_tracing():
+            self.traced = tracemalloc.get_traced_memory()
+            self.snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+            ))
+
+    def add(self, name: str, obj, data_points: int = None):
+        """Measure a structure
+
+        Arguments:
+            name {str} -- Name of the structure in the report
+            obj {object} -- The structure
+
+        Keyword Arguments:
+            data_points {int} -- Number of data points held by the structure.
+                Keep as None to count the numeric values found by the walk
+                (default: {None})
+        """
+        if obj is None:
+            return
+
+        (size, values) = deep_sizeof(obj, self.seen)
+        if data_points is None:
+            data_points = values
+        self.rows.append((name, size, data_points))
+
+    def format(self, top: int = 10):
+        """Format the report as text
+
+        Keyword Arguments:
+            top {int} -- Number of allocation sites listed when allocations
+                         are traced (default: {10})
+
+        Returns:
+            str -- The report
+        """
+        lines = [f'{"Structure":<28}{"Bytes":>14}{"Data points":>14}{"Bytes/point":>14}']
+        total = 0
+        for (name, size, data_points) in self.rows:
+            total += size
+            per_point = f'{size / data_points:.1f}' if data_points else '-'
+            lines.append(
+                f'{name:<28}{size:>14,}{data_points:>14,}{per_point:>14}')
+        lines.append(f'{"Total":<28}{total:>14,}')
+
+        # ru_maxrss is expressed in kilobytes on Linux
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        lines.append('')
+        lines.append(f'Peak RSS: {peak_rss:,} bytes')
+
+        if self.snapshot is None:
+            lines.append('Allocations are not traced, set PYTHONTRACEMALLOC=1 '
+                         'to include them')
+            return '\n'.join(lines)
+
+        (current, peak) = self.traced
+        lines.append(f'Traced memory: {current:,} bytes (peak {peak:,} bytes)')
+
+        if stages:
+            lines.append('')
+            lines.append(f'{"Loading stage":<28}{"Bytes held":>14}{"Seconds":>14}')
+            for (name, size, elapsed) in stages:
+                lines.append(f'{name:<28}{size:>14,}{elapsed:>14.2f}')
+
+        lines.append('')
+        lines.append(f'Top {top} allocation sites:')
+        for statistic in self.snapshot.statistics('lineno')[:top]:
+            frame = statistic.traceback[0]
+            lines.append(f'{statistic.size:>14,}  {frame.filename}:{frame.lineno}')
+
+        return '\n'.join(lines)
@@ -1,9 +1,13 @@
 import logging
+from contextlib import contextmanager
 from enum import Enum
 from datetime import date
 import csv
 from typing import NamedTuple
 
+from datafile import open_data_file
+from storage import MemoryPopulationStorage, PopulationStorage
+
 logger = logging.getLogger(__name__)
 
 
@@ -32,14 +36,20 @@ class PopulationDataParser(object):
         self.skip_first = skip_first
         self.data_file = pop_csv
 
-    def parse(self):
+    def parse(self, storage: PopulationStorage = None):
         """Parse the csv file and return the population data as an object
 
+        Keyword Arguments:
+            storage {PopulationStorage} -- Backend that stores the parsed
+                data. Keep as None to store the data in memory
+                (default: {None})
+
         Returns:
             PopulationData -- Population data encapsulation object
         """
-        pop_data = PopulationData()
-        with open(self.data_file, buffering=131072) as f:
+        pop_data = PopulationData(storage)
+        with open_data_file(self.data_file, buffering=131072) as f, \
+                pop_data.bulk_load():
             logger.info(f'Parsing population data file {self.data_file}')
 
             csv_reader = csv.reader(f, delimiter=',', quotechar='"')
@@ -53,7 +63,7 @@ class PopulationDataParser(object):
                      str_pop_female, str_pop_total, str_pop_density) = line
                 except ValueError as e:
                     logger.debug(
-                        f'Incorrect number of columns in {data_file.path}:{line_count}\n' +
+                        f'Incorrect number of columns in {self.data_file}:{line_count}\n' +
                         f'Line content: {line}'
                     )
                     continue
@@ -94,9 +104,17 @@ class PopulationData(dict):
     using convenienec methods.
     """
 
-    def __init__(self):
+    def __init__(self, storage: PopulationStorage = None):
+        """Initialize a PopulationData object
+
+        Keyword Arguments:
+            storage {PopulationStorage} -- Backend that stores the data. Keep
+                as None to store the data in memory (default: {None})
+        """
         super().__init__()
-        self.data = {}
+        if storage is None:
+            storage = MemoryPopulationStorage()
+        self.storage = storage
 
     def add_data(self, data_type: PopulationEnum, country: str, year: int, val: int):
         """Add a population data point
@@ -113,21 +131,7 @@ class PopulationData(dict):
         if year < 1:
             raise ValueError('Year must be a positive integer')
 
-        self._add_data(data_type, country, year, val)
-
-    def _add_country(self, country: str):
-        """Create the an empty data structure for a country
-
-        Arguments:
-            country {str} -- The country name
-        """
-        self.data[country] = {
-            'aliases': [],
-            PopulationEnum.MALE: {},
-            PopulationEnum.FEMALE: {},
-            PopulationEnum.TOTAL: {},
-            PopulationEnum.DENSITY: {},
-        }
+        self.storage.add_data(data_type, country, year, val)
 
     def add_country_aliases(self, country: str, *aliases: str):
         """Add aliases to a country that will be used for country lookups
@@ -137,23 +141,17 @@ class PopulationData(dict):
             *aliases {str} -- The aliases to added
         """
         country = country.lower()
-        if country not in self.data:
-            raise ValueError('Failed to add aliases for {country} because it does not exist in the data')
-        for alias in list(aliases):
-            self.data[country]['aliases'].append(alias.lower())
-
-    def _add_year(self, country: str, year: int):
-        for pop_type in PopulationEnum:
-            self.data[country][pop_type][date] = 0
-
-    def _add_data(self, data_type: PopulationEnum, country: str, year: int, val: int):
-        if country not in self.data:
-            self._add_country(country)
-
-        if year not in self.data[country][data_type]:
-            self._add_year(country, year)
-
-        self.data[country][data_type][year] = val
+        if not self.storage.has_country(country):
+            raise ValueError(f'Failed to add aliases for {country} because it does not exist in the data')
+        self.storage.add_aliases(country, [alias.lower() for alias in aliases])
+
+    @contextmanager
+    def bulk_load(self):
+        """Context manager that groups the data added within it into a single
+        storage transaction
+        """
+        with self.storage.bulk_load():
+            yield self
 
     def get_countries(self):
         """Get a list of countries that have data
@@ -161,7 +159,7 @@ class PopulationData(dict):
         Returns:
             list -- List of countries
         """
-        return list(self.data.keys())
+        return self.storage.get_countries()
 
     def get_total(self, country: str, year=None):
         """Get the total population for the requested country
@@ -228,18 +226,13 @@ class PopulationData(dict):
         if year is None:
             year = date.today().year
 
-        if country not in self.data:
-            country = self._search_country_alias(country)
+        if not self.storage.has_country(country):
+            country = self.storage.resolve_alias(country)
             if country is None:
                 return -1
 
-        if year not in self.data[country][data_type]:
+        value = self.storage.get_value(data_type, country, year)
+        if value is None:
             return -1
 
-        return self.data[country][data_type][year]
-
-    def _search_country_alias(self, country):
-        for key in self.data.keys():
-            if country in self.data[key]['aliases']:
-                return key
-        return None
+        return value
@@ -0,0 +1,289 @@
+import logging
+import math
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from itertools import repeat
+from typing import NamedTuple
+
+from coviddata import COVIDData, COVIDEnum
+from encodedseries import EncodedSeries
+
+logger = logging.getLogger(__name__)
+
+# Number of trailing days the models are fitted on
+PROJECTION_WINDOW = 14
+# Number of days projected after the last date
+PROJECTION_DAYS = 14
+# Minimum number of positive values in the window to fit a model
+MIN_FIT_POINTS = 5
+# Carrying capacities tried by the logistic fit, as multiples of the last
+# value
+LOGISTIC_CAPACITIES = tuple(1.01 * 1.1 ** step for step in range(50))
+# Number of series fitted by each task sent to the process pool
+CHUNK_SIZE = 64
+
+
+class Projection(NamedTuple):
+    """Projected cumulative values of a series
+
+    values starts with the last observed value, followed by one value per
+    projected day.
+    """
+    model: str
+    values: array
+
+
+def _linear_fit(points: list):
+    """Least squares fit of a line through (x, y) points
+
+    Returns:
+        (intercept {float}, slope {float}) -- The line or None if every x is
+            the same
+    """
+    count = len(points)
+    mean_x = sum(x for x, _ in points) / count
+    mean_y = sum(y for _, y in points) / count
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if variance == 0:
+        return None
+
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+    return mean_y - slope * mean_x, slope
+
+
+def _squared_error(model, values: list):
+    return sum((model(t) - value) ** 2 for t, value in enumerate(values))
+
+
+def fit_exponential(values: list):
+    """Fit y = exp(a + b t) to a series
+
+    Returns:
+        (error {float}, model {function}) -- The sum of squared errors and
+            the fitted function of t, or None if the series cannot be fitted
+    """
+    points = [(t, math.log(value)) for t, value in enumerate(values)
+              if value > 0]
+    if len(points) < MIN_FIT_POINTS:
+        return None
+
+    line = _linear_fit(points)
+    if line is None:
+        return None
+
+    (intercept, slope) = line
+
+    def model(t):
+        return math.exp(intercept + slope * t)
+
+    return _squared_error(model, values), model
+
+
+def fit_logistic(values: list):
+    """Fit y = K / (1 + exp(-r (t - t0))) to a series. The growth rate and
+    midpoint are fitted by linear regression for each of the
+    LOGISTIC_CAPACITIES and the capacity with the lowest error is kept.
+
+    Returns:
+        (error {float}, model {function}) -- The sum of squared errors and
+            the fitted function of t, or None if the series cannot be fitted
+    """
+    positive = [(t, value) for t, value in enumerate(values) if value > 0]
+    if len(positive) < MIN_FIT_POINTS:
+        return None
+
+    peak = max(values)
+    best = None
+    for factor in LOGISTIC_CAPACITIES:
+        capacity = values[-1] * factor
+        if capacity <= peak:
+            continue
+
+        line = _linear_fit([(t, math.log(capacity / value - 1))
+                            for t, value in positive])
+        if line is None:
+            continue
+
+        (intercept, slope) = line
+
+        def model(t, capacity=capacity, intercept=intercept, slope=slope):
+            exponent = intercept + slope * t
+            if exponent > 700:
+                return 0.0
+            return capacity / (1 + math.exp(exponent))
+
+        error = _squared_error(model, values)
+        if best is None or error < best[0]:
+            best = (error, model)
+
+    return best
+
+
+def project_series(values: list, days: int = PROJECTION_DAYS):
+    """Fit the exponential and logistic models to a window of cumulative
+    values and project the best fitting one
+
+    Arguments:
+        values {list} -- Trailing window of cumulative values
+
+    Keyword Arguments:
+        days {int} -- Number of days to project (default: {PROJECTION_DAYS})
+
+    Returns:
+        (model {str}, values {list}) -- The name of the model and the last
+            value followed by the projected values, or None if no model
+            could be fitted
+    """
+    if not values or values[-1] <= 0:
+        return None
+
+    fits = []
+    for (name, fit) in (('exponential', fit_exponential),
+                        ('logistic', fit_logistic)):
+        try:
+            result = fit(values)
+        except (OverflowError, ValueError, ZeroDivisionError):
+            continue
+        if result is not None:
+            fits.append((result[0], name, result[1]))
+    if not fits:
+        return None
+
+    (_, name, model) = min(fits, key=lambda fit: fit[0])
+    last = len(values) - 1
+    try:
+        projected = [max(values[-1], round(model(last + day)))
+                     for day in range(1, days + 1)]
+    except OverflowError:
+        return None
+    return name, [values[-1]] + projected
+
+
+def _project_chunk(chunk: list, days: int):
+    """Project a chunk of series in a worker process
+
+    Arguments:
+        chunk {list} -- (country, data type value, window) tuples
+        days {int} -- Number of days to project
+
+    Returns:
+        list -- (country, data type value, model, values) tuples of the
+                series that could be projected
+    """
+    results = []
+    for (country, data_type, window) in chunk:
+        projection = project_series(window, days)
+        if projection is not None:
+            results.append((country, data_type) + projection)
+    return results
+
+
+class Projections(object):
+    """Table of short-term projections of every country and data type
+
+    The projections are fitted in a pool of worker processes by refresh(),
+    which should be called whenever new data is loaded, and are JSON encoded
+    like the series of DerivedMetrics. Lookups are then plain dictionary
+    accesses.
+    """
+
+    def __init__(self, covid_data: COVIDData, window: int = PROJECTION_WINDOW,
+                 days: int = PROJECTION_DAYS, max_workers: int = None):
+        """Initialize a Projections object and fit the projections
+
+        Arguments:
+            covid_data {COVIDData} -- COVID-19 datasets
+
+        Keyword Arguments:
+            window {int} -- Number of trailing days the models are fitted on
+                            (default: {PROJECTION_WINDOW})
+            days {int} -- Number of days projected after the last date
+                          (default: {PROJECTION_DAYS})
+            max_workers {int} -- Number of worker processes, None for the
+                                 number of CPUs and 0 to fit in the current
+                                 process (default: {None})
+        """
+        super().__init__()
+        if window < MIN_FIT_POINTS:
+            raise ValueError(
+                f'Projection window must be at least {MIN_FIT_POINTS} days')
+        if days < 1:
+            raise ValueError('Projection days must be a positive integer')
+
+        self.covid_data = covid_data
+        self.window = window
+        self.days = days
+        self.max_workers = max_workers
+        self.projections = {}
+        self.encoded = {}
+        self.encoded_future_dates = None
+        self.encoded_days = None
+        self.refresh()
+
+    def refresh(self):
+        """Fit the projections of the current data"""
+        chunks = []
+        chunk = []
+        for country in self.covid_data.get_countries():
+            for data_type in COVIDEnum:
+                series = self.covid_data.get_series(data_type, country)
+                chunk.append((country, data_type.value,
+                              series[-self.window:].tolist()))
+                if len(chunk) == CHUNK_SIZE:
+                    chunks.append(chunk)
+                    chunk = []
+        if chunk:
+            chunks.append(chunk)
+
+        workers = self.max_workers
+        if workers is None:
+            workers = os.cpu_count() or 1
+        logger.info(
+            f'Fitting projections of {len(chunks)} chunks of series with {workers} workers')
+        if workers == 0:
+            results = map(_project_chunk, chunks, repeat(self.days))
+            self._set_results(results)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                self._set_results(
+                    executor.map(_project_chunk, chunks, repeat(self.days)))
+
+    def _set_results(self, results):
+        self.projections = {}
+        self.encoded = {}
+        for chunk_results in results:
+            for (country, data_type, model, values) in chunk_results:
+                key = (country, COVIDEnum(data_type))
+                self.projections[key] = Projection(model, array('l', values))
+                self.encoded[key] = EncodedSeries.from_values(values)
+
+        dates = self.covid_data.get_dates()
+        future_dates = []
+        if dates:
+            last = date.fromisoformat(dates[-1])
+            future_dates = [(last + timedelta(days=day)).isoformat()
+                            for day in range(1, self.days + 1)]
+        self.encoded_future_dates = EncodedSeries.from_values(future_dates)
+        self.encoded_days = EncodedSeries.from_values(
+            range(len(dates) + self.days))
+        logger.info(f'Fitted {len(self.projections)} projections')
+
+    def get_projection(self, data_type: COVIDEnum, country: str):
+        """Get the projection of a series
+
+        Returns:
+            Projection -- The projection or None if the series could not be
+                          fitted
+        """
+        return self.projections.get((country, data_type))
+
+    def get_encoded(self, data_type: COVIDEnum, country: str):
+        """Get the JSON encoded values of a projection
+
+        Returns:
+            EncodedSeries -- The encoded values or None if the series could
+                             not be fitted
+        """
+        return self.encoded.get((country, data_type))
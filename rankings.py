@@ -0,0 +1,218 @@
+import logging
+from bisect import bisect_left, bisect_right
+from enum import Enum
+from itertools import accumulate
+
+from coviddata import COVIDData, COVIDEnum
+
+logger = logging.getLogger(__name__)
+
+
+class RankingMetric(Enum):
+    TOTAL = 'total'
+    NEW_DAY = 'new-day'
+    NEW_WEEK = 'new-week'
+
+
+class RankingIndex(object):
+    """Countries sorted by the value of a single metric
+
+    The values are kept in ascending order alongside their prefix sums so
+    that top-N, percentile and rank-range sum queries never have to visit
+    every country.
+    """
+
+    def __init__(self, country_values: dict):
+        """Initialize a RankingIndex object
+
+        Arguments:
+            country_values {dict} -- Mapping of country name to metric value
+        """
+        super().__init__()
+        ranked = sorted(country_values.items(), key=lambda item: item[1])
+        self.countries = [country for country, _ in ranked]
+        self.values = [value for _, value in ranked]
+        self.prefix_sums = [0] + list(accumulate(self.values))
+        self.lookup = country_values
+
+    def __len__(self):
+        return len(self.values)
+
+    def top(self, n: int):
+        """Get the n countries with the highest values
+
+        Arguments:
+            n {int} -- Number of countries to return
+
+        Returns:
+            list -- (country, value) tuples in descending order of value
+        """
+        n = max(0, min(n, len(self.values)))
+        start = len(self.values) - n
+        return list(zip(reversed(self.countries[start:]),
+                        reversed(self.values[start:])))
+
+    def percentile(self, country: str):
+        """Get the percentage of countries with a value less than or equal to
+        that of the requested country
+
+        Arguments:
+            country {str} -- The country name
+
+        Returns:
+            float -- Percentile rank between 0 and 100 or None if the country
+                     is not ranked
+        """
+        if country not in self.lookup or not self.values:
+            return None
+
+        rank = bisect_right(self.values, self.lookup[country])
+        return rank * 100 / len(self.values)
+
+    def value_at_percentile(self, percentile: float):
+        """Get the metric value found at the requested percentile
+
+        Arguments:
+            percentile {float} -- Percentile between 0 and 100
+
+        Returns:
+            int -- Metric value or None if no countries are ranked
+        """
+        if not self.values:
+            return None
+
+        percentile = max(0, min(percentile, 100))
+        index = min(int(percentile * len(self.values) / 100),
+                    len(self.values) - 1)
+        return self.values[index]
+
+    def count_between(self, low: int, high: int):
+        """Count the countries with a value in the range [low, high]"""
+        return bisect_right(self.values, high) - bisect_left(self.values, low)
+
+    def sum_top(self, n: int):
+        """Get the sum of the values of the n highest ranked countries"""
+        n = max(0, min(n, len(self.values)))
+        return self.prefix_sums[-1] - self.prefix_sums[len(self.values) - n]
+
+
+class COVIDRankings(object):
+    """Precomputed cross-country rankings and group aggregates
+
+    A RankingIndex is kept for every combination of COVIDEnum and
+    RankingMetric. The indices and the group sums are rebuilt by refresh(),
+    which should be called whenever new data is loaded.
+    """
+
+    def __init__(self, covid_data: COVIDData):
+        """Initialize a COVIDRankings object and build the indices
+
+        Arguments:
+            covid_data {COVIDData} -- COVID-19 datasets to rank
+        """
+        super().__init__()
+        self.covid_data = covid_data
+        self.groups = {}
+        self.indices = {}
+        self.group_sums = {}
+        self.refresh()
+
+    def refresh(self):
+        """Rebuild the ranking indices and group sums from the data"""
+        logger.info('Building COVID-19 ranking indices')
+        countries = self.covid_data.get_countries()
+        for data_type in COVIDEnum:
+            metric_values = {metric: {} for metric in RankingMetric}
+            for country in countries:
+                values = self.covid_data.get_series(data_type, country)
+                for metric in RankingMetric:
+                    metric_values[metric][country] = \
+                        COVIDRankings._compute_metric(metric, values)
+
+            for metric in RankingMetric:
+                self.indices[(data_type, metric)] = \
+                    RankingIndex(metric_values[metric])
+
+        self.group_sums = {}
+        for group in self.groups:
+            self._sum_group(group)
+
+    def add_group(self, group: str, *countries: str):
+        """Define a named group of countries that can be aggregated
+
+        Arguments:
+            group {str} -- The group name
+            *countries {str} -- Countries that belong to the group
+        """
+        if group == '':
+            raise ValueError('Group cannot be empty')
+
+        self.groups[group] = list(countries)
+        self._sum_group(group)
+
+    def get_groups(self):
+        """Get the names of the defined country groups
+
+        Returns:
+            list -- Group names
+        """
+        return list(self.groups.keys())
+
+    def get_top(self, data_type: COVIDEnum, metric: RankingMetric, n: int = 10):
+        """Get the n highest ranked countries for a metric
+
+        Arguments:
+            data_type {COVIDEnum} -- The type of data to rank
+            metric {RankingMetric} -- The metric to rank by
+
+        Keyword Arguments:
+            n {int} -- Number of countries to return (default: {10})
+
+        Returns:
+            list -- (country, value) tuples in descending order of value
+        """
+        return self.indices[(data_type, metric)].top(n)
+
+    def get_percentile(self, data_type: COVIDEnum, metric: RankingMetric, country: str):
+        """Get the percentile rank of a country for a metric
+
+        Returns:
+            float -- Percentile rank between 0 and 100 or None if the country
+                     is not ranked
+        """
+        return self.indices[(data_type, metric)].percentile(country)
+
+    def get_value_at_percentile(self, data_type: COVIDEnum, metric: RankingMetric, percentile: float):
+        """Get the metric value found at a percentile across all countries"""
+        return self.indices[(data_type, metric)].value_at_percentile(percentile)
+
+    def get_group_sum(self, group: str, data_type: COVIDEnum, metric: RankingMetric):
+        """Get the sum of a metric across the countries of a group
+
+        Returns:
+            int -- Sum of the metric or None if the group is not defined
+        """
+        if group not in self.groups:
+            return None
+        return self.group_sums[group][(data_type, metric)]
+
+    def _sum_group(self, group: str):
+        sums = {}
+        for key, index in self.indices.items():
+            sums[key] = sum(index.lookup.get(country, 0)
+                            for country in self.groups[group])
+        self.group_sums[group] = sums
+
+    @staticmethod
+    def _compute_metric(metric: RankingMetric, values):
+        if not values:
+            return 0
+        if metric == RankingMetric.TOTAL:
+            return values[-1]
+        if metric == RankingMetric.NEW_DAY:
+            days = 1
+        else:
+            days = 7
+        if len(values) <= days:
+            return values[-1]
+        return values[-1] - values[-1 - days]
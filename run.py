@@ -1,14 +1,22 @@
 #!/usr/bin/env python3
 
 import argparse
+import hashlib
 from logging.config import dictConfig
 import logging
+import os.path
+import sys
 
 import app
 import coviddata
 from dataloader import DataDownload
+from datafile import strip_compression_suffix
+import datasource
 import gunicorn.app.base
+import memoryreport
 import populationdata
+import storage
+import usdata
 
 
 # Setup logging
@@ -36,9 +44,15 @@ logger = logging.getLogger(__name__)
 
 def main():
     opts = get_config()
+    if opts.memory_report:
+        memoryreport.start_tracing()
 
     logger.info("Preparing for data retrieval")
-    data_download = DataDownload(opts.tempdir)
+    source = None
+    if opts.mirror is not None:
+        logger.info(f'Reading data files from mirror {opts.mirror}')
+        source = datasource.create_source(opts.mirror)
+    data_download = DataDownload(opts.tempdir, source=source)
     data_download.add_download(
         "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv",
         "covid19_confirmed.csv")
@@ -48,6 +62,12 @@ def main():
     data_download.add_download(
         "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_recovered_global.csv",
         "covid19_recovered.csv")
+    data_download.add_download(
+        "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_US.csv",
+        "covid19_confirmed_us.csv")
+    data_download.add_download(
+        "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_US.csv",
+        "covid19_deaths_us.csv")
     data_download.add_download(
         "https://population.un.org/wpp/Download/Files/1_Indicators%20(Standard)/CSV_FILES/WPP2019_TotalPopulationBySex.csv",
         "total_population_data.csv"
@@ -57,40 +77,195 @@ def main():
 
     data = {}
     for file_path in data_file_paths:
-        if file_path.endswith('covid19_confirmed.csv'):
+        file_name = strip_compression_suffix(file_path)
+        if file_name.endswith('covid19_confirmed.csv'):
             data['infected'] = file_path
-        elif file_path.endswith('covid19_deaths.csv'):
+        elif file_name.endswith('covid19_deaths.csv'):
             data['dead'] = file_path
-        elif file_path.endswith('covid19_recovered.csv'):
+        elif file_name.endswith('covid19_recovered.csv'):
             data['recovered'] = file_path
-        elif file_path.endswith('total_population_data.csv'):
+        elif file_name.endswith('covid19_confirmed_us.csv'):
+            data['us_infected'] = file_path
+        elif file_name.endswith('covid19_deaths_us.csv'):
+            data['us_dead'] = file_path
+        elif file_name.endswith('total_population_data.csv'):
             data['population'] = file_path
 
-    logger.info('Parsing COVID-19 data')
+    missing = [key for key in ('infected', 'dead', 'recovered', 'population')
+               if key not in data]
+    if missing:
+        logger.error(
+            f'Unable to start without the {", ".join(missing)} data')
+        sys.exit(1)
+
+    if opts.memory_report:
+        load_app(opts, data)
+        print(app.get_memory_report())
+        return
+
+    if not opts.no_figure_cache:
+        # Cleared once here rather than by each server, which would wipe the
+        # entries stored by the others when it is started or restarted
+        app.clear_figure_cache(get_figure_cache_path(opts))
+
+    options = {
+        'bind': '%s:%s' % (opts.listen, opts.port),
+        'workers': opts.workers,
+        'worker_class': opts.worker_class,
+        'threads': opts.threads,
+        'keepalive': opts.keepalive,
+        'preload_app': opts.preload
+    }
+    StandaloneApplication(lambda: load_app(opts, data), options).run()
+
+
+def load_app(opts, data: dict):
+    """Parse the data files and create the Dash app. Runs once in the
+    gunicorn master process before the servers are forked, unless
+    --no-preload is given and each server runs it.
+
+    Arguments:
+        opts {argparse.args} -- The command line parameters
+        data {dict} -- Data file paths by kind
+
+    Returns:
+        Server -- A flask server object
+    """
+    covid_storage = None
+    population_storage = None
+    if opts.storage == 'sqlite':
+        storage_path = opts.storage_path or \
+            os.path.join(opts.tempdir, 'data.sqlite')
+        logger.info(f'Storing data in SQLite database {storage_path}')
+        covid_storage = storage.SQLiteCOVIDStorage(storage_path)
+        population_storage = storage.SQLitePopulationStorage(storage_path)
+
+    with memoryreport.stage('COVID-19 data'):
+        covid_data = load_covid_data(data, covid_storage)
+
+    with memoryreport.stage('Population data'):
+        population_data = load_population_data(data, population_storage)
+
+    us_data = None
+    if 'us_infected' in data and 'us_dead' in data:
+        logger.info('Parsing US county data')
+        with memoryreport.stage('US county data'):
+            try:
+                us_data = usdata.USCountyDataParser(
+                    data['us_infected'], data['us_dead']).parse()
+            except ValueError as e:
+                logger.error(f'Starting without US county data: {e}')
+
+    with memoryreport.stage('Derived data'):
+        projection_workers = None
+        if opts.projection_workers is not None:
+            projection_workers = int(opts.projection_workers)
+        app.set_data(covid_data, population_data, us_data,
+                     projection_workers=projection_workers,
+                     enable_projections=not opts.no_projections)
+    if not opts.no_figure_cache and not opts.memory_report:
+        app.set_figure_cache(get_figure_cache_path(opts),
+                             int(opts.figure_cache_size) * 1024 * 1024)
+    with memoryreport.stage('Application layout'):
+        app.create()
+
+    if opts.memory_endpoint and not opts.memory_report:
+        app.enable_memory_endpoint()
+
+    return app.start()
+
+
+def get_figure_cache_path(opts):
+    return opts.figure_cache or os.path.join(opts.tempdir, 'figures.sqlite')
+
+
+def load_covid_data(data: dict, covid_storage: storage.SQLiteCOVIDStorage = None):
+    """Parse the COVID-19 data files. Data already loaded in a SQLite storage
+    from the same files is used as is, so that the storage is never cleared
+    under another running instance.
+
+    Arguments:
+        data {dict} -- Data file paths by kind
+
+    Keyword Arguments:
+        covid_storage {SQLiteCOVIDStorage} -- Storage of the parsed data,
+            None to keep it in memory (default: {None})
+
+    Returns:
+        COVIDData -- The COVID-19 data
+    """
     data_parser = coviddata.COVIDDataParser(
-        data['infected'], data['recovered'], data['dead'])
-    covid_data = data_parser.parse()
+        infected_csv=data['infected'], dead_csv=data['dead'],
+        recovered_csv=data['recovered'])
+    if covid_storage is None:
+        logger.info('Parsing COVID-19 data')
+        return data_parser.parse()
+
+    version = get_files_version(data['infected'], data['dead'],
+                                data['recovered'])
+    with covid_storage.bulk_load():
+        if covid_storage.get_source_version() != version:
+            logger.info('Parsing COVID-19 data')
+            covid_storage.clear()
+            covid_data = data_parser.parse(covid_storage)
+            covid_storage.set_source_version(version)
+            return covid_data
+
+    logger.info('Using the COVID-19 data already in storage')
+    covid_data = coviddata.COVIDData(covid_storage)
+    covid_data.build_crossings()
+    return covid_data
+
+
+def load_population_data(data: dict,
+                         population_storage: storage.SQLitePopulationStorage = None):
+    """Parse the population data file and add the country aliases. See
+    load_covid_data()
+
+    Returns:
+        PopulationData -- The population data
+    """
+    data_parser = populationdata.PopulationDataParser(data['population'])
+    if population_storage is None:
+        logger.info('Parsing population data')
+        return add_population_aliases(data_parser.parse())
 
-    logger.info('Parsing population data')
-    population_data = populationdata.PopulationDataParser(
-        data['population']).parse()
+    version = get_files_version(data['population'])
+    with population_storage.bulk_load():
+        if population_storage.get_source_version() == version:
+            logger.info('Using the population data already in storage')
+            return populationdata.PopulationData(population_storage)
+
+        logger.info('Parsing population data')
+        population_storage.clear()
+        population_data = add_population_aliases(
+            data_parser.parse(population_storage))
+        population_storage.set_source_version(version)
+    return population_data
+
+
+def add_population_aliases(population_data: populationdata.PopulationData):
     population_data.add_country_aliases(
         'United States of America', 'US', 'USA')
     population_data.add_country_aliases(
         'Dem. People\'s Republic of Korea', 'North Korea', 'Korea, North')
     population_data.add_country_aliases(
         'Republic of Korea', 'South Korea', 'Korea, South')
+    return population_data
 
-    app.set_data(covid_data, population_data)
-    app.create()
 
-    server = app.start()
+def get_files_version(*paths: str):
+    """Get a digest of the contents of data files
 
-    options = {
-        'bind': '%s:%s' % (opts.listen, opts.port),
-        'workers': opts.workers
-    }
-    StandaloneApplication(server, options).run()
+    Returns:
+        str -- Hex digest of the files
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(131072), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
 
 
 def get_config():
@@ -125,21 +300,125 @@ def get_config():
         help="Number of servers to start"
     )
 
+    parser.add_argument(
+        "-k", "--worker-class",
+        default="sync",
+        help="Type of gunicorn worker to use (sync, gthread, gevent, ...)"
+    )
+
+    parser.add_argument(
+        "--threads",
+        default=1,
+        help="Number of threads per server for the gthread worker class"
+    )
+
+    parser.add_argument(
+        "--keepalive",
+        default=2,
+        help="Seconds to wait for requests on a keep-alive connection"
+    )
+
+    parser.add_argument(
+        "--preload",
+        action="store_true",
+        default=True,
+        help="Load the data once before the servers are forked and share it with them (default)"
+    )
+
+    parser.add_argument(
+        "--no-preload",
+        dest="preload",
+        action="store_false",
+        help="Load the data in each server instead, for example so servers restarted by gunicorn pick up new data files"
+    )
+
     parser.add_argument(
         "-t", "--tempdir",
         default='/tmp/covid19',
         help="Temporary data storage path"
     )
 
+    parser.add_argument(
+        "-m", "--mirror",
+        default=None,
+        help="Read the data files from a local mirror directory or zip/tar archive instead of downloading them"
+    )
+
+    parser.add_argument(
+        "-s", "--storage",
+        default="memory",
+        choices=["memory", "sqlite"],
+        help="Storage backend of the parsed data"
+    )
+
+    parser.add_argument(
+        "--storage-path",
+        default=None,
+        help="SQLite storage database path (default: TEMPDIR/data.sqlite)"
+    )
+
+    parser.add_argument(
+        "--figure-cache",
+        default=None,
+        help="Figure cache database path shared by the servers (default: TEMPDIR/figures.sqlite)"
+    )
+
+    parser.add_argument(
+        "--figure-cache-size",
+        default=64,
+        help="Maximum size of the figure cache in MiB"
+    )
+
+    parser.add_argument(
+        "--no-figure-cache",
+        action="store_true",
+        help="Compute every figure without sharing it between servers"
+    )
+
+    parser.add_argument(
+        "--projection-workers",
+        default=None,
+        help="Number of processes fitting the projections after the data is loaded (default: number of CPUs, 0 fits them in the main process)"
+    )
+
+    parser.add_argument(
+        "--no-projections",
+        action="store_true",
+        help="Do not fit projections of the data"
+    )
+
+    parser.add_argument(
+        "--memory-report",
+        action="store_true",
+        help="Load the data, print a report of the memory it holds and exit"
+    )
+
+    parser.add_argument(
+        "--memory-endpoint",
+        action="store_true",
+        help="Serve the memory report of each server on /_memory-report"
+    )
+
     logger.debug('Parsing and validating command line parameters')
     return parser.parse_args()
 
 
 class StandaloneApplication(gunicorn.app.base.BaseApplication):
 
-    def __init__(self, app, options=None):
+    def __init__(self, loader, options=None):
+        """Initialize the gunicorn application
+
+        Arguments:
+            loader {function} -- Loads the data and returns the WSGI
+                                 application. gunicorn calls it in the
+                                 master process when preload_app is set and
+                                 in each worker otherwise
+
+        Keyword Arguments:
+            options {dict} -- gunicorn settings (default: {None})
+        """
         self.options = options or {}
-        self.application = app
+        self.loader = loader
         super().__init__()
 
     def load_config(self):
@@ -149,7 +428,7 @@ class StandaloneApplication(gunicorn.app.base.BaseApplication):
             self.cfg.set(key.lower(), value)
 
     def load(self):
-        return self.application
+        return self.loader()
 
 
 if __name__ == "__main__":
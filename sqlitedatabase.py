@@ -0,0 +1,75 @@
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteDatabase(object):
+    """SQLite database file on local disk shared by several processes
+
+    The database runs in write-ahead logging mode so readers never wait on
+    writers or take locks that block them. SQLite connections must not be
+    shared across threads or be inherited by forked worker processes, so
+    every thread of every process gets its own connection.
+    """
+
+    def __init__(self, path: str, timeout: float):
+        """Initialize a SQLiteDatabase object
+
+        Arguments:
+            path {str} -- Path of the SQLite database file
+            timeout {float} -- Seconds a statement waits for a lock held by
+                               another connection
+        """
+        super().__init__()
+        self.path = path
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def create(self, schema: tuple, timeout: float = None):
+        """Create the database file and the tables it is missing and switch
+        it to write-ahead logging mode
+
+        Arguments:
+            schema {tuple} -- Statements run in a single transaction, which
+                              must leave existing tables unchanged
+
+        Keyword Arguments:
+            timeout {float} -- Seconds waited for the lock of the database,
+                               for example while the first of several
+                               processes starting together creates it. None
+                               to wait as long as statements do
+                               (default: {None})
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = self.get_connection()
+        if timeout is not None:
+            connection.execute(f'PRAGMA busy_timeout = {int(timeout * 1000)}')
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            with connection:
+                for statement in schema:
+                    connection.execute(statement)
+        finally:
+            if timeout is not None:
+                connection.execute(
+                    f'PRAGMA busy_timeout = {int(self.timeout * 1000)}')
+
+    def get_connection(self):
+        """Get the connection of the current thread and process
+
+        Returns:
+            sqlite3.Connection -- The connection
+        """
+        pid = os.getpid()
+        if getattr(self.local, 'pid', None) != pid:
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+            self.local.pid = pid
+        return self.local.connection
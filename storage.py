@@ -0,0 +1,455 @@
+import logging
+import sys
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from sqlitedatabase import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class COVIDStorage(object):
+    """Storage backend interface of COVIDData
+
+    Data types are the COVIDEnum members handed over by COVIDData. Dates are
+    date ordinals (date.toordinal()) on a single sorted axis shared by every
+    series.
+    """
+
+    def add_series(self, data_type, country: str, ordinals: list, values: list):
+        """Add values to those already stored for the dates of a country
+
+        Arguments:
+            data_type {COVIDEnum} -- The type of data being provided
+            country {str} -- The country name
+            ordinals {list} -- Date ordinals of the values
+            values {list} -- The values, one per date ordinal
+        """
+        raise NotImplementedError
+
+    def get_countries(self):
+        """Get countries that have data
+
+        Returns:
+            list -- Country names
+        """
+        raise NotImplementedError
+
+    def get_dates(self):
+        """Get the shared date axis
+
+        Returns:
+            list -- Sorted date ordinals
+        """
+        raise NotImplementedError
+
+    def get_date_position(self, ordinal: int):
+        """Get the position of a date on the shared date axis
+
+        Returns:
+            int -- The position or None if the date has no data
+        """
+        raise NotImplementedError
+
+    def get_series(self, data_type, country: str, first: int = 0,
+                   stop: int = None):
+        """Get the values of a country aligned with the shared date axis,
+        optionally restricted to the positions first to stop (excluded)
+
+        Returns:
+            array -- The values or None if the country has no data
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def bulk_load(self):
+        """Context manager that groups the data added within it into a single
+        transaction where the backend supports it
+        """
+        yield self
+
+    def clear(self):
+        """Remove all stored data"""
+        raise NotImplementedError
+
+
+class PopulationStorage(object):
+    """Storage backend interface of PopulationData
+
+    Data types are the PopulationEnum members handed over by PopulationData.
+    Country names and aliases are stored lowercase.
+    """
+
+    def add_data(self, data_type, country: str, year: int, val: int):
+        """Set the value of a population data point"""
+        raise NotImplementedError
+
+    def add_aliases(self, country: str, aliases: list):
+        """Add aliases to an existing country"""
+        raise NotImplementedError
+
+    def has_country(self, country: str):
+        raise NotImplementedError
+
+    def get_countries(self):
+        """Get a list of countries that have data
+
+        Returns:
+            list -- List of countries
+        """
+        raise NotImplementedError
+
+    def get_value(self, data_type, country: str, year: int):
+        """Get a population data point
+
+        Returns:
+            int -- The value or None if there is no data for that year
+        """
+        raise NotImplementedError
+
+    def resolve_alias(self, alias: str):
+        """Get the country that an alias refers to
+
+        Returns:
+            str -- The country name or None if the alias is unknown
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def bulk_load(self):
+        """Context manager that groups the data added within it into a single
+        transaction where the backend supports it
+        """
+        yield self
+
+    def clear(self):
+        """Remove all stored data"""
+        raise NotImplementedError
+
+
+class MemoryCOVIDStorage(COVIDStorage):
+    """Keeps an array of values per country and data type in memory"""
+
+    def __init__(self):
+        super().__init__()
+        self.data = {}
+        self.dates = []
+        self.date_index = {}
+
+    def add_series(self, data_type, country: str, ordinals: list, values: list):
+        if country not in self.data:
+            self._add_country(country)
+
+        country_data = self.data[country]
+        if data_type not in country_data:
+            country_data[data_type] = array('l', [0]) * len(self.dates)
+
+        for ordinal, value in zip(ordinals, values):
+            position = self.date_index.get(ordinal)
+            if position is None:
+                position = self._add_date(ordinal)
+
+            # Add data from new record to existing value for that date
+            # Existing value could be from records separted by province
+            country_data[data_type][position] += value
+
+    def _add_country(self, country: str):
+        self.data[sys.intern(country)] = {}
+
+    def _add_date(self, ordinal: int):
+        position = bisect_left(self.dates, ordinal)
+        self.dates.insert(position, ordinal)
+        for country_data in self.data.values():
+            for series in country_data.values():
+                series.insert(position, 0)
+
+        if position == len(self.dates) - 1:
+            self.date_index[ordinal] = position
+        else:
+            self.date_index = {day: i for i, day in enumerate(self.dates)}
+
+        return position
+
+    def get_countries(self):
+        return list(self.data.keys())
+
+    def get_dates(self):
+        return self.dates
+
+    def get_date_position(self, ordinal: int):
+        return self.date_index.get(ordinal)
+
+    def get_series(self, data_type, country: str, first: int = 0,
+                   stop: int = None):
+        if country not in self.data:
+            return None
+
+        country_data = self.data[country]
+        if data_type not in country_data:
+            country_data[data_type] = array('l', [0]) * len(self.dates)
+        if first == 0 and stop is None:
+            return country_data[data_type]
+        return country_data[data_type][first:stop]
+
+    def clear(self):
+        self.data = {}
+        self.dates = []
+        self.date_index = {}
+
+
+class MemoryPopulationStorage(PopulationStorage):
+    """Keeps a dictionary of values per country, data type and year in
+    memory
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.data = {}
+
+    def add_data(self, data_type, country: str, year: int, val: int):
+        if country not in self.data:
+            self._add_country(country)
+
+        self.data[country].setdefault(data_type, {})[year] = val
+
+    def _add_country(self, country: str):
+        self.data[sys.intern(country)] = {'aliases': []}
+
+    def add_aliases(self, country: str, aliases: list):
+        self.data[country]['aliases'].extend(aliases)
+
+    def has_country(self, country: str):
+        return country in self.data
+
+    def get_countries(self):
+        return list(self.data.keys())
+
+    def get_value(self, data_type, country: str, year: int):
+        return self.data[country].get(data_type, {}).get(year)
+
+    def resolve_alias(self, alias: str):
+        for key in self.data.keys():
+            if alias in self.data[key]['aliases']:
+                return key
+        return None
+
+    def clear(self):
+        self.data = {}
+
+
+class SQLiteStorage(object):
+    """Base class of the storage backends kept in an embedded SQLite database
+    on disk. The database can be shared by several processes.
+    """
+
+    # Name of the data set in the storage_meta table
+    NAME = None
+    SCHEMA = ()
+    META_SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS storage_meta ('
+        'name TEXT NOT NULL PRIMARY KEY, version TEXT NOT NULL) WITHOUT ROWID',
+    )
+
+    def __init__(self, path: str):
+        """Initialize the storage and create its tables if needed
+
+        Arguments:
+            path {str} -- Path of the SQLite database file
+        """
+        super().__init__()
+        self.path = path
+        self.database = SQLiteDatabase(path, timeout=30)
+        self.in_bulk_load = False
+        self.database.create(self.META_SCHEMA + self.SCHEMA)
+
+    @contextmanager
+    def bulk_load(self):
+        """Context manager that groups the data read and added within it into
+        a single transaction. The write lock is taken when the transaction
+        starts so that concurrent loads of the same database run one after
+        the other, and processes reading the database keep seeing the
+        previous data until it commits. Nested calls join the transaction.
+        """
+        if self.in_bulk_load:
+            yield self
+            return
+
+        connection = self._get_connection()
+        self.in_bulk_load = True
+        try:
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                yield self
+        finally:
+            self.in_bulk_load = False
+        self._on_change()
+
+    def get_source_version(self):
+        """Get the version of the source files the stored data was loaded
+        from
+
+        Returns:
+            str -- The version or None if it was not recorded
+        """
+        row = self._get_connection().execute(
+            'SELECT version FROM storage_meta WHERE name = ?',
+            (self.NAME,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def set_source_version(self, version: str):
+        """Record the version of the source files the stored data was loaded
+        from
+        """
+        self._write(
+            'INSERT OR REPLACE INTO storage_meta (name, version) VALUES (?, ?)',
+            ((self.NAME, version),))
+
+    def _write(self, statement: str, parameters):
+        """Run a write statement, committing it unless a bulk load is in
+        progress
+        """
+        connection = self._get_connection()
+        connection.executemany(statement, parameters)
+        if not self.in_bulk_load:
+            connection.commit()
+            self._on_change()
+
+    def _on_change(self):
+        pass
+
+    def _get_connection(self):
+        return self.database.get_connection()
+
+
+class SQLiteCOVIDStorage(SQLiteStorage, COVIDStorage):
+    """Stores the COVID-19 data in a SQLite table indexed on
+    (country, type, date)
+    """
+
+    NAME = 'covid_data'
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS covid_data ('
+        'country TEXT NOT NULL, type TEXT NOT NULL, date INTEGER NOT NULL, '
+        'value INTEGER NOT NULL, PRIMARY KEY (country, type, date)) '
+        'WITHOUT ROWID',
+        'CREATE INDEX IF NOT EXISTS covid_data_date ON covid_data (date)',
+    )
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.dates = None
+        self.date_index = None
+
+    def add_series(self, data_type, country: str, ordinals: list, values: list):
+        self._write(
+            'INSERT INTO covid_data (country, type, date, value) '
+            'VALUES (?, ?, ?, ?) ON CONFLICT (country, type, date) '
+            'DO UPDATE SET value = value + excluded.value',
+            ((country, data_type.value, ordinal, value)
+             for ordinal, value in zip(ordinals, values)))
+
+    def _on_change(self):
+        self.dates = None
+        self.date_index = None
+
+    def get_countries(self):
+        return [country for (country,) in self._get_connection().execute(
+            'SELECT DISTINCT country FROM covid_data ORDER BY country')]
+
+    def get_dates(self):
+        if self.dates is None:
+            self.dates = [ordinal for (ordinal,) in self._get_connection().execute(
+                'SELECT DISTINCT date FROM covid_data ORDER BY date')]
+            self.date_index = {day: i for i, day in enumerate(self.dates)}
+        return self.dates
+
+    def get_date_position(self, ordinal: int):
+        self.get_dates()
+        return self.date_index.get(ordinal)
+
+    def get_series(self, data_type, country: str, first: int = 0,
+                   stop: int = None):
+        window = self.get_dates()[first:stop]
+        rows = []
+        if window:
+            rows = self._get_connection().execute(
+                'SELECT date, value FROM covid_data WHERE country = ? '
+                'AND type = ? AND date BETWEEN ? AND ? ORDER BY date',
+                (country, data_type.value, window[0], window[-1])).fetchall()
+        if not rows and not self._has_country(country):
+            return None
+
+        series = array('l', [0]) * len(window)
+        for ordinal, value in rows:
+            series[self.date_index[ordinal] - first] = value
+        return series
+
+    def _has_country(self, country: str):
+        return self._get_connection().execute(
+            'SELECT 1 FROM covid_data WHERE country = ? LIMIT 1',
+            (country,)).fetchone() is not None
+
+    def clear(self):
+        self._write('DELETE FROM covid_data', ((),))
+        self._write('DELETE FROM storage_meta WHERE name = ?', ((self.NAME,),))
+
+
+class SQLitePopulationStorage(SQLiteStorage, PopulationStorage):
+    """Stores the population data in a SQLite table indexed on
+    (country, year)
+    """
+
+    NAME = 'population_data'
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS population_data ('
+        'country TEXT NOT NULL, year INTEGER NOT NULL, type TEXT NOT NULL, '
+        'value INTEGER NOT NULL, PRIMARY KEY (country, year, type)) '
+        'WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS population_aliases ('
+        'alias TEXT NOT NULL, country TEXT NOT NULL, '
+        'PRIMARY KEY (alias, country)) WITHOUT ROWID',
+    )
+
+    def add_data(self, data_type, country: str, year: int, val: int):
+        self._write(
+            'INSERT OR REPLACE INTO population_data (country, year, type, value) '
+            'VALUES (?, ?, ?, ?)', ((country, year, data_type.value, val),))
+
+    def add_aliases(self, country: str, aliases: list):
+        self._write(
+            'INSERT OR IGNORE INTO population_aliases (alias, country) '
+            'VALUES (?, ?)', ((alias, country) for alias in aliases))
+
+    def has_country(self, country: str):
+        return self._get_connection().execute(
+            'SELECT 1 FROM population_data WHERE country = ? LIMIT 1',
+            (country,)).fetchone() is not None
+
+    def get_countries(self):
+        return [country for (country,) in self._get_connection().execute(
+            'SELECT DISTINCT country FROM population_data ORDER BY country')]
+
+    def get_value(self, data_type, country: str, year: int):
+        row = self._get_connection().execute(
+            'SELECT value FROM population_data '
+            'WHERE country = ? AND year = ? AND type = ?',
+            (country, year, data_type.value)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def resolve_alias(self, alias: str):
+        row = self._get_connection().execute(
+            'SELECT country FROM population_aliases WHERE alias = ? '
+            'ORDER BY country LIMIT 1', (alias,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def clear(self):
+        self._write('DELETE FROM population_data', ((),))
+        self._write('DELETE FROM population_aliases', ((),))
+        self._write('DELETE FROM storage_meta WHERE name = ?', ((self.NAME,),))
@@ -0,0 +1,359 @@
+import csv
+import logging
+from array import array
+from itertools import islice
+from operator import add
+
+from coviddata import COVIDData, COVIDDataParser, COVIDEnum
+from datafile import open_data_file
+
+logger = logging.getLogger(__name__)
+
+
+class USCountyDataParser(object):
+    """Parses the JHU US county level time series csv files
+
+    Rows are read in chunks of a bounded size and their values are appended
+    to flat integer arrays so the parser never holds more than one chunk of
+    csv rows in memory.
+    """
+
+    def __init__(self, infected_csv: str, dead_csv: str, chunk_size: int = 256):
+        """Initialize a USCountyDataParser object
+
+        Arguments:
+            infected_csv {str} -- Path to the US confirmed cases csv file
+            dead_csv {str} -- Path to the US deaths csv file
+
+        Keyword Arguments:
+            chunk_size {int} -- Number of csv rows parsed at a time
+                                (default: {256})
+        """
+        super().__init__()
+        if chunk_size < 1:
+            raise ValueError('Chunk size must be a positive integer')
+
+        self.data_files = {
+            COVIDEnum.INFECTED: infected_csv,
+            COVIDEnum.DEAD: dead_csv,
+        }
+        self.chunk_size = chunk_size
+
+    def parse(self):
+        """Parse the csv files and return the county data as an object
+
+        Returns:
+            USCountyData -- US county data encapsulation object
+        """
+        us_data = USCountyData()
+        columns = {}
+        for data_type, path in self.data_files.items():
+            with open_data_file(path, buffering=131072, newline='') as f:
+                header = next(csv.reader(f, delimiter=',', quotechar='"'), None)
+            if header is None:
+                raise ValueError(f'US county data file {path} is empty')
+            columns[data_type] = USCountyDataParser._map_columns(header)
+        us_data.set_dates(USCountyDataParser._align_dates(columns))
+
+        for data_type, path in self.data_files.items():
+            logger.info(f'Parsing US county data file {path}')
+            with open_data_file(path, buffering=131072, newline='') as f:
+                csv_reader = csv.reader(f, delimiter=',', quotechar='"')
+                next(csv_reader)
+
+                line_count = 1
+                while True:
+                    chunk = list(islice(csv_reader, self.chunk_size))
+                    if not chunk:
+                        break
+                    self._parse_chunk(us_data, data_type, columns[data_type],
+                                      chunk, path, line_count)
+                    line_count += len(chunk)
+
+            logger.debug(
+                f'Parsed {line_count - 1} US county rows from {path}')
+
+        us_data.roll_up()
+        return us_data
+
+    def _parse_chunk(self, us_data, data_type: COVIDEnum, columns: dict,
+                     chunk: list, path: str, line_count: int):
+        date_slice = columns['date_slice']
+        date_indexes = columns['date_indexes']
+        for row in chunk:
+            line_count += 1
+            if len(row) != columns['width']:
+                logger.debug(
+                    f'Incorrect number of columns in {path}:{line_count}\n' +
+                    f'Line content: {row}'
+                )
+                continue
+
+            if date_slice is not None:
+                cells = row[date_slice]
+            else:
+                cells = [row[index] for index in date_indexes]
+            try:
+                uid = int(row[columns['UID']])
+                values = [int(float(value)) if value != '' else 0
+                          for value in cells]
+            except ValueError:
+                logger.debug(
+                    f'Invalid numeric value in {path}:{line_count}\n' +
+                    f'Line content: {row}'
+                )
+                continue
+
+            population = None
+            if 'Population' in columns:
+                try:
+                    population = int(row[columns['Population']] or 0)
+                except ValueError:
+                    # The values are kept, the county has no population
+                    logger.debug(
+                        f'Invalid population in {path}:{line_count}\n' +
+                        f'Line content: {row}'
+                    )
+
+            us_data.add_county(data_type, uid, row[columns['Province_State']],
+                               row[columns['Admin2']], row[columns['FIPS']],
+                               values, population)
+
+    @staticmethod
+    def _map_columns(header: list):
+        columns = {'width': len(header)}
+        for required in ('UID', 'FIPS', 'Admin2', 'Province_State'):
+            if required not in header:
+                raise ValueError(f'US county data is missing column {required}')
+            columns[required] = header.index(required)
+        if 'Population' in header:
+            columns['Population'] = header.index('Population')
+
+        dates = []
+        for index, key in enumerate(header):
+            parsed_date = COVIDDataParser._parse_date(key)
+            if parsed_date is None:
+                continue
+            if not dates:
+                columns['first_date'] = index
+            dates.append(parsed_date)
+
+        if not dates or columns['first_date'] + len(dates) != len(header):
+            raise ValueError('US county data dates must be the trailing columns')
+        columns['dates'] = dates
+
+        return columns
+
+    @staticmethod
+    def _align_dates(columns: dict):
+        """Find the dates found in every file and the columns that hold them
+
+        The files are not always updated together, so the dates missing from
+        one of them are dropped rather than rejecting the data.
+
+        Arguments:
+            columns {dict} -- Column maps of the files by data type. The
+                              positions of the shared dates are added to them
+
+        Returns:
+            list -- Ordered list of the shared date objects
+        """
+        shared = None
+        for file_columns in columns.values():
+            dates = set(file_columns['dates'])
+            shared = dates if shared is None else shared & dates
+        dates = sorted(shared)
+        if not dates:
+            raise ValueError('US county data files have no dates in common')
+
+        for data_type, file_columns in columns.items():
+            if len(file_columns['dates']) != len(dates):
+                logger.warning(
+                    f'Ignoring {len(file_columns["dates"]) - len(dates)} dates '
+                    f'of the US {data_type.value} data missing from other files')
+            positions = {day: file_columns['first_date'] + index
+                         for index, day in enumerate(file_columns['dates'])}
+            indexes = [positions[day] for day in dates]
+            file_columns['date_indexes'] = indexes
+            # Shared dates are usually contiguous columns read with a slice
+            file_columns['date_slice'] = None
+            if indexes == list(range(indexes[0], indexes[0] + len(indexes))):
+                file_columns['date_slice'] = slice(indexes[0], indexes[-1] + 1)
+
+        return dates
+
+
+class USCountyData(object):
+    """US county level data rolled up to states and to the country
+
+    County values are kept in one flat array per data type with a row of
+    len(dates) values per county. State and national totals are computed
+    once by roll_up().
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.dates = []
+        self._iso_dates = None
+        self.counties = {}
+        self.county_lookup = {}
+        self.populations = {}
+        self.values = {
+            COVIDEnum.INFECTED: array('i'),
+            COVIDEnum.DEAD: array('i'),
+        }
+        self.rows = {
+            COVIDEnum.INFECTED: {},
+            COVIDEnum.DEAD: {},
+        }
+        self.states = {}
+        self.national = {}
+
+    def set_dates(self, dates: list):
+        """Set the dates shared by every county series
+
+        Arguments:
+            dates {list} -- Ordered list of date objects
+        """
+        if self.dates and self.dates != dates:
+            raise ValueError('US county data files have different dates')
+        self.dates = dates
+        self._iso_dates = None
+
+    def get_dates(self):
+        """Get the ISO formatted dates shared by every series
+
+        Returns:
+            list -- Dates as YYYY-MM-DD strings
+        """
+        if self._iso_dates is None:
+            self._iso_dates = [day.isoformat() for day in self.dates]
+        return self._iso_dates
+
+    def add_county(self, data_type: COVIDEnum, uid: int, state: str,
+                   county: str, fips: str, values: list, population: int = None):
+        """Add the series of a county
+
+        Arguments:
+            data_type {COVIDEnum} -- The type of data being provided
+            uid {int} -- Unique identifier of the county
+            state {str} -- The state name
+            county {str} -- The county name
+            fips {str} -- The county FIPS code
+            values {list} -- Cumulative values, one per date
+
+        Keyword Arguments:
+            population {int} -- The county population (default: {None})
+        """
+        if data_type not in self.values:
+            raise ValueError(f'US county data has no {data_type.value} data')
+        if state == '':
+            raise ValueError('State cannot be empty')
+        if len(values) != len(self.dates):
+            raise ValueError('County series must have one value per date')
+
+        if uid not in self.counties:
+            self.counties[uid] = (state, county, fips)
+            self.county_lookup[(state, county)] = uid
+        if population is not None:
+            self.populations[uid] = population
+
+        rows = self.rows[data_type]
+        if uid in rows:
+            offset = rows[uid] * len(self.dates)
+            self.values[data_type][offset:offset + len(values)] = \
+                array('i', values)
+        else:
+            rows[uid] = len(rows)
+            self.values[data_type].extend(values)
+
+    def roll_up(self):
+        """Sum the county series into state and national series"""
+        logger.info('Rolling US county data up to states')
+        num_dates = len(self.dates)
+        for data_type, rows in self.rows.items():
+            values = self.values[data_type]
+            states = {}
+            for uid, row in rows.items():
+                state = self.counties[uid][0]
+                if state not in states:
+                    states[state] = array('q', bytes(8 * num_dates))
+                offset = row * num_dates
+                states[state] = array('q', map(
+                    add, states[state], values[offset:offset + num_dates]))
+
+            national = array('q', bytes(8 * num_dates))
+            for state_series in states.values():
+                national = array('q', map(add, national, state_series))
+
+            self.states[data_type] = states
+            self.national[data_type] = national
+
+    def get_states(self):
+        """Get the states that have data
+
+        Returns:
+            list -- State names
+        """
+        return sorted(set(state for (state, _, _) in self.counties.values()))
+
+    def get_counties(self, state: str):
+        """Get the counties of a state that have data
+
+        Arguments:
+            state {str} -- The state name
+
+        Returns:
+            list -- County names
+        """
+        return [county for (county_state, county, _) in self.counties.values()
+                if county_state == state]
+
+    def get_population(self, state: str, county: str = None):
+        """Get the population of a state or of one of its counties
+
+        Arguments:
+            state {str} -- The state name
+
+        Keyword Arguments:
+            county {str} -- The county name. Keep as None to get the state
+                            population (default: {None})
+
+        Returns:
+            int -- Population total or -1 if it is unknown
+        """
+        if county is not None:
+            uid = self.county_lookup.get((state, county))
+            return self.populations.get(uid, -1)
+
+        uids = [uid for uid, (county_state, _, _) in self.counties.items()
+                if county_state == state and uid in self.populations]
+        if not uids:
+            return -1
+        return sum(self.populations[uid] for uid in uids)
+
+    def get_bycounty(self, data_type: COVIDEnum, state: str, county: str,
+                     cumulative: bool = True):
+        uid = self.county_lookup.get((state, county))
+        if data_type not in self.rows or uid not in self.rows[data_type]:
+            return None
+
+        num_dates = len(self.dates)
+        offset = self.rows[data_type][uid] * num_dates
+        series = self.values[data_type][offset:offset + num_dates]
+        return self._to_dict(series, cumulative)
+
+    def get_bystate(self, data_type: COVIDEnum, state: str, cumulative: bool = True):
+        if data_type not in self.states or state not in self.states[data_type]:
+            return None
+        return self._to_dict(self.states[data_type][state], cumulative)
+
+    def get_national(self, data_type: COVIDEnum, cumulative: bool = True):
+        if data_type not in self.national:
+            return None
+        return self._to_dict(self.national[data_type], cumulative)
+
+    def _to_dict(self, series: array, cumulative: bool):
+        if not cumulative:
+            series = COVIDData._to_daily(series)
+        return dict(zip(self.get_dates(), series))